@@ -6,81 +6,1628 @@ an index.html file that lists all the notebooks. It handles both regular noteboo
 (from the notebooks/ directory) and apps (from the apps/ directory).
 
 The script can be run from the command line with optional arguments:
-    uv run .github/scripts/build.py [--output-dir OUTPUT_DIR]
+    uv run .github/scripts/build.py main [--output-dir OUTPUT_DIR] [--jobs N]
+
+To keep the output up to date while editing, run the watch command instead:
+    uv run .github/scripts/build.py watch [--output-dir OUTPUT_DIR]
 
 The exported files will be placed in the specified output directory (default: _site).
+Per-notebook export logs are written to the build directory (default: _build).
+Python files that do not define a marimo app are modules that the notebooks import; they
+are not exported themselves, but marimo bundles them into the exports of the notebooks.
+Exports of unchanged notebooks are restored from a cache in the build directory,
+use --no-cache to export every notebook again. With --shared-envs, notebooks that
+declare the same inline script dependencies are exported from one reused environment
+instead of a fresh --sandbox environment per notebook.
+
+Every build writes a timing report (timings.json) to the build directory and logs a
+summary of the slowest notebooks.
+
+With --fingerprint, public/ assets get content-hashed copies that can be cached forever
+(listed in asset-manifest.json), and with --compress, .gz and .br siblings are written
+for all compressible files in the output directory. With --dedup, byte-identical files
+across the exported folders are stored only once in the _shared/ folder of the output.
+
+Each export is stopped after --timeout seconds, and exports that fail because of a
+transient network or package resolution error are retried (--retries). If any notebook
+fails, the build exits with a non-zero status and a summary of the failures; with
+--fail-fast the build stops at the first failure.
+
+GPX files in public/ folders get compact, delta-encoded binary copies and a manifest.json
+with a summary of each track, which the GPX viewer reads instead of the XML files. With
+--tiles and --tile-url, the map tiles around the tracks are downloaded into public/tiles/,
+so that the GPX viewers can show their maps without a tile provider. The tile_server
+command serves placeholder tiles locally, as a stand-in for a tile provider:
+    uv run .github/scripts/build.py tile_server [--port 8700]
+
+Next to index.html, a catalog.json lists all notebooks and apps with their paths,
+modes, sizes and modification times, so that the index page can load, search and
+paginate large collections lazily.
 """
 
-# /// script
-# requires-python = ">=3.12"
-# dependencies = [
-#     "jinja2==3.1.3",
-#     "fire==0.7.0",
-#     "loguru==0.7.0"
-# ]
-# ///
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "jinja2==3.1.3",
+#     "fire==0.7.0",
+#     "loguru==0.7.0",
+#     "brotli==1.1.0",
+#     "numpy>=2.0.0",
+#     "gpxpy>=1.6.2"
+# ]
+# ///
+
+import filecmp
+import functools
+import gzip
+import hashlib
+import json
+import math
+import os
+import re
+import signal
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tomllib
+import urllib.error
+import urllib.request
+import zlib
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterator, List, Tuple, Union
+from pathlib import Path
+from xml.etree import ElementTree
+
+import jinja2
+import fire
+
+from loguru import logger
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is declared in the script metadata
+    brotli = None
+
+# Folder of the apps, whose GPX reader and track geometry the compact tracks are written with
+_APPS_DIR: Path = Path(__file__).resolve().parents[2] / "apps"
+
+# Exports run in private staging directories; merging them into the output directory
+# is serialised so that concurrent exports never write the same assets at once
+_merge_lock = threading.Lock()
+
+# Inline script metadata block as specified by PEP 723 (# /// script ... # ///)
+_SCRIPT_METADATA = re.compile(r"(?m)^# /// script$\s(?P<content>(^#(| .*)$\s)+)^# ///$")
+
+# Shared export environments, keyed by their dependency set; each environment is
+# created by the first export that needs it while other exports of the group wait
+_environment_locks: Dict[str, threading.Lock] = {}
+_environment_locks_guard = threading.Lock()
+_environments_created: List[str] = []
+_environments_used: Dict[str, int] = {}
+
+# Set to stop the remaining exports after a failure in --fail-fast mode; running export
+# processes are tracked so that they can be stopped as well
+_abort = threading.Event()
+_running: set = set()
+_running_lock = threading.Lock()
+
+# Errors of uv that are caused by the network or package index, not the notebook. Only
+# uv's own error lines are matched: "error:" and "Caused by:" lines, and the "×", "├─▶"
+# and "╰─▶" lines of its diagnostics, so that a notebook error that mentions e.g. a
+# status code or a timeout is not exported again
+_TRANSIENT_ERROR = re.compile(
+    r"^\s*(error:|caused by:|×|├─▶|╰─▶) .*("
+    r"failed to (download|fetch)|error sending request|http status server error|too many requests"
+    r"|connection (reset|refused|closed|aborted)|operation timed out|temporary failure in name resolution"
+    r"|dns error|network is unreachable|tcp connect error|could not connect"
+    r")",
+    re.IGNORECASE | re.MULTILINE,
+)
+
+# Timing records of the current build, one per stage or exported notebook
+_timings: List[dict] = []
+_timings_lock = threading.Lock()
+
+# File types that are worth serving precompressed; images, fonts and wasm modules are
+# either compressed already or compressed by the server
+_COMPRESSIBLE_SUFFIXES = {
+    ".html", ".js", ".mjs", ".css", ".json", ".webmanifest", ".svg", ".txt", ".md",
+    ".csv", ".tsv", ".xml", ".gpx", ".py", ".map", ".bin",
+}
+
+# Number of notebooks and apps per section that are rendered into index.html; the rest
+# of the collection is loaded from catalog.json by the index page
+_INDEX_PAGE_SIZE = 24
+
+# Durations reported by uv while it sets up a sandbox, e.g. "Resolved 38 packages in 2.34s"
+_UV_DURATION = re.compile(
+    r"^\s*(?:Resolved|Prepared|Installed|Uninstalled|Audited|Bytecode compiled) .* in (?P<duration>[\dhms. ]+)$",
+    re.MULTILINE,
+)
+
+# Compact track files store delta-encoded int32 columns: coordinates in microdegrees,
+# elevations in decimetres and times in seconds since the start of the track
+_TRACK_SCALES = {"lat": 1_000_000, "lon": 1_000_000, "ele": 10, "time": 1}
+
+# Map styles of the apps whose tiles can be prefetched for offline use, with their
+# attributions. The public servers of these providers do not allow bulk downloads, so the
+# tiles are prefetched from a server given with --tile-url, e.g. a self-hosted one or one
+# whose plan allows it
+_TILE_PROVIDERS = {
+    "OpenStreetMap Mapnik": "&copy; OpenStreetMap contributors",
+    "CartoDB Voyager": "&copy; OpenStreetMap contributors &copy; CARTO",
+    "Cartodb Positron": "&copy; OpenStreetMap contributors &copy; CARTO",
+    "Stadia Outdoors": "&copy; Stadia Maps &copy; OpenMapTiles &copy; OpenStreetMap contributors",
+    "Stadia StamenTerrain": "&copy; Stadia Maps &copy; Stamen Design &copy; OpenMapTiles &copy; OpenStreetMap contributors",
+}
+
+# Tile servers ask bulk downloads to keep the number of connections low
+_TILE_CONNECTIONS = 2
+
+
+@contextmanager
+def _timed(stage: str, **fields) -> Iterator[dict]:
+    """Time a build stage and add it to the timing report.
+
+    Args:
+        stage (str): Name of the stage, e.g. "discovery" or "notebook"
+        **fields: Additional fields of the timing record, e.g. the folder or notebook
+
+    Yields:
+        dict: The timing record, which can be extended with more fields inside the context
+    """
+    record: dict = {"stage": stage, **fields}
+    start: float = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 3)
+        with _timings_lock:
+            _timings.append(record)
+
+
+@contextmanager
+def _stopwatch(record: dict | None, key: str) -> Iterator[None]:
+    """Add the duration of a block to a field of a timing record.
+
+    Args:
+        record (dict | None): Timing record to update, or None to not record the duration
+        key (str): Field of the record to which the duration is added
+
+    Yields:
+        None
+    """
+    start: float = time.perf_counter()
+    try:
+        yield
+    finally:
+        if record is not None:
+            record[key] = round(record.get(key, 0.0) + time.perf_counter() - start, 3)
+
+
+def _parse_duration(text: str) -> float:
+    """Parse a duration as printed by uv, e.g. "788ms", "2.34s" or "1m 17s".
+
+    Args:
+        text (str): Duration text
+
+    Returns:
+        float: Duration in seconds
+    """
+    units: Dict[str, float] = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    return sum(
+        float(value) * units[unit] for value, unit in re.findall(r"([\d.]+)\s*(ms|h|m|s)", text)
+    )
+
+
+def _sandbox_setup_seconds(stderr: str | None) -> float:
+    """Estimate how long the sandbox environment setup took from the output of uv.
+
+    Args:
+        stderr (str | None): Captured standard error of the marimo export command
+
+    Returns:
+        float: Total duration of the resolve, prepare, install and compile steps in seconds
+    """
+    return sum(_parse_duration(m.group("duration")) for m in _UV_DURATION.finditer(stderr or ""))
+
+
+@contextmanager
+def _notebook_log(notebook_path: Path, log_dir: Path | None) -> Iterator[Path | None]:
+    """Route all log messages about a single notebook to its own log file.
+
+    Every message logged inside the context is tagged with the notebook path, so that
+    interleaved output from parallel exports can be told apart. If a log directory is
+    given, the tagged messages are also written to <log_dir>/<notebook>.log.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file) being exported
+        log_dir (Path | None): Directory for per-notebook log files, or None to disable them
+
+    Yields:
+        Path | None: Path to the notebook's log file, or None if log files are disabled
+    """
+    if log_dir is None:
+        with logger.contextualize(notebook=str(notebook_path)):
+            yield None
+        return
+
+    log_file: Path = log_dir / notebook_path.with_suffix(".log")
+    log_file.parent.mkdir(parents=True, exist_ok=True)
+    log_file.unlink(missing_ok=True)
+
+    sink_id = logger.add(
+        log_file,
+        filter=lambda record: record["extra"].get("notebook") == str(notebook_path),
+    )
+    try:
+        with logger.contextualize(notebook=str(notebook_path)):
+            yield log_file
+    finally:
+        logger.remove(sink_id)
+
+
+def _export_html_wasm(
+    notebook_path: Path,
+    output_dir: Path,
+    as_app: bool = False,
+    log_dir: Path | None = None,
+    cache_dir: Path | None = None,
+    env_dir: Path | None = None,
+    timeout: float | None = None,
+    retries: int = 0,
+) -> bool:
+    """Export a single marimo notebook to HTML/WebAssembly format.
+
+    This function takes a marimo notebook (.py file) and exports it to HTML/WebAssembly format.
+    If as_app is True, the notebook is exported in "run" mode with code hidden, suitable for
+    applications. Otherwise, it's exported in "edit" mode, suitable for interactive notebooks.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file) to export
+        output_dir (Path): Directory where the exported HTML file will be saved
+        as_app (bool, optional): Whether to export as an app (run mode) or notebook (edit mode).
+                                Defaults to False.
+        log_dir (Path | None, optional): Directory for per-notebook log files. Defaults to None.
+        cache_dir (Path | None, optional): Directory of the export cache, or None to always export.
+                                           Defaults to None.
+        env_dir (Path | None, optional): Directory of the shared export environments, or None to
+                                         export each notebook in its own sandbox. Defaults to None.
+        timeout (float | None, optional): Seconds after which the export is stopped, or None to
+                                          wait indefinitely. Defaults to None.
+        retries (int, optional): Number of retries after a transient error. Defaults to 0.
+
+    Returns:
+        bool: True if export succeeded, False otherwise
+    """
+    mode: str = "app" if as_app else "notebook"
+    with (
+        _notebook_log(notebook_path, log_dir) as log_file,
+        _timed("notebook", notebook=str(notebook_path), mode=mode) as timing,
+    ):
+        timing["success"] = False
+
+        # In --fail-fast mode, exports that have not started yet are skipped after a failure
+        if _abort.is_set():
+            timing["error"] = "skipped after an earlier failure"
+            return False
+
+        # The environment is needed first, because the version of marimo in it is part of the cache key
+        environment: Path | None = None
+        if env_dir is not None:
+            with _stopwatch(timing, "environment"):
+                environment = _shared_environment(notebook_path, env_dir)
+
+        cache_entry: Path | None = None
+        if cache_dir is not None and _marimo_version(environment) != "unknown":
+            cache_entry = cache_dir / _cache_key(notebook_path, as_app=as_app, environment=environment)
+            with _stopwatch(timing, "copy"):
+                restored: bool = _restore_from_cache(cache_entry, output_dir / notebook_path.parent)
+            timing["cache"] = "hit" if restored else "miss"
+            if restored:
+                logger.info(f"Restored {notebook_path} from cache ({cache_entry.name[:12]})")
+                timing["success"] = True
+                return True
+
+        timing["success"] = _run_export(
+            notebook_path,
+            output_dir,
+            as_app=as_app,
+            log_file=log_file,
+            cache_entry=cache_entry,
+            environment=environment,
+            timing=timing,
+            timeout=timeout,
+            retries=retries,
+        )
+        return timing["success"]
+
+
+def _run_export(
+    notebook_path: Path,
+    output_dir: Path,
+    as_app: bool,
+    log_file: Path | None,
+    cache_entry: Path | None = None,
+    environment: Path | None = None,
+    timing: dict | None = None,
+    timeout: float | None = None,
+    retries: int = 0,
+    backoff: float = 5.0,
+) -> bool:
+    """Run the marimo export command for a single notebook.
+
+    The notebook is exported into a private staging directory first. marimo writes its
+    runtime assets next to the exported HTML file, so exporting several notebooks from
+    the same folder in parallel would otherwise write the same files concurrently.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file) to export
+        output_dir (Path): Directory where the exported HTML file will be saved
+        as_app (bool): Whether to export as an app (run mode) or notebook (edit mode)
+        log_file (Path | None): Log file that receives the output of the marimo command
+        cache_entry (Path | None, optional): Cache entry in which to store the export. Defaults to None.
+        environment (Path | None, optional): Prepared environment that contains marimo and the
+                                             notebook's dependencies, or None to export in a
+                                             sandbox. Defaults to None.
+        timing (dict | None, optional): Timing record of the notebook, which receives the
+                                        durations of the environment setup, the export and
+                                        the copying of the exported files, and the error if the
+                                        export failed. Defaults to None.
+        timeout (float | None, optional): Seconds after which the export is stopped, or None to
+                                          wait indefinitely. Defaults to None.
+        retries (int, optional): Number of retries after a transient error. Defaults to 0.
+        backoff (float, optional): Seconds to wait before the first retry; the wait doubles
+                                   with every retry. Defaults to 5.0.
+
+    Returns:
+        bool: True if export succeeded, False otherwise
+    """
+    # Record errors in the timing report, so that they can be summarised at the end
+    timing = timing if timing is not None else {}
+
+    # Convert .py extension to .html for the output file
+    output_path: Path = notebook_path.with_suffix(".html")
+
+    # Base command for marimo export
+    if environment is not None:
+        # The shared environment already has the notebook's dependencies installed
+        cmd: List[str] = [str(environment / "bin" / "marimo"), "export", "html-wasm"]
+    else:
+        cmd: List[str] = ["uvx", "marimo", "export", "html-wasm", "--sandbox"]
+
+    # Configure export mode based on whether it's an app or a notebook
+    if as_app:
+        logger.info(f"Exporting {notebook_path} to {output_path} as app")
+        cmd.extend(["--mode", "run", "--no-show-code"])  # Apps run in "run" mode with hidden code
+    else:
+        logger.info(f"Exporting {notebook_path} to {output_path} as notebook")
+        cmd.extend(["--mode", "edit"])  # Notebooks run in "edit" mode
+
+    try:
+        # Create full output path and ensure directory exists
+        output_file: Path = output_dir / notebook_path.with_suffix(".html")
+        output_file.parent.mkdir(parents=True, exist_ok=True)
+
+        with tempfile.TemporaryDirectory(prefix="marimo-export-") as staging:
+            # Add notebook path and staged output file to command
+            cmd.extend([str(notebook_path), "-o", str(Path(staging) / output_file.name)])
+
+            # Run marimo export command, retrying transient failures with exponential backoff
+            for attempt in range(retries + 1):
+                timing["attempts"] = attempt + 1
+                logger.debug(f"Running command: {cmd}")
+                try:
+                    with _stopwatch(timing, "export"):
+                        result = _run_command(cmd, timeout=timeout)
+                    break
+                except subprocess.CalledProcessError as e:
+                    if attempt == retries or _abort.is_set() or not _TRANSIENT_ERROR.search(e.stderr or ""):
+                        raise
+                    _write_command_output(log_file, e.stdout, e.stderr)
+                    delay: float = backoff * 2**attempt
+                    logger.warning(
+                        f"Transient error exporting {notebook_path} (attempt {attempt + 1} of {retries + 1}), "
+                        f"retrying in {delay:.0f}s"
+                    )
+                    # In --fail-fast mode, the export is not retried after a failure elsewhere
+                    if _abort.wait(delay):
+                        timing["error"] = "stopped after an earlier failure"
+                        logger.warning(f"Stopped exporting {notebook_path} after an earlier failure")
+                        return False
+            _write_command_output(log_file, result.stdout, result.stderr)
+
+            # In a sandbox, uv reports how long it took to set up the environment
+            if environment is None:
+                setup: float = min(_sandbox_setup_seconds(result.stderr), timing["export"])
+                timing["environment"] = round(timing.get("environment", 0.0) + setup, 3)
+                timing["export"] = round(timing["export"] - setup, 3)
+
+            with _stopwatch(timing, "copy"):
+                # Keep a copy of the export, so that it can be reused while the notebook is unchanged
+                if cache_entry is not None:
+                    _store_in_cache(Path(staging), cache_entry)
+
+                # Move the exported notebook and its assets into the output directory
+                with _merge_lock:
+                    shutil.copytree(staging, output_file.parent, copy_function=_copy_file, dirs_exist_ok=True)
+
+        logger.info(f"Successfully exported {notebook_path}")
+        return True
+    except subprocess.TimeoutExpired as e:
+        # Handle hanging exports
+        _write_command_output(log_file, e.stdout, e.stderr)
+        timing["error"] = f"timed out after {timeout:.0f}s"
+        logger.error(f"Export of {notebook_path} timed out after {timeout:.0f}s")
+        return False
+    except subprocess.CalledProcessError as e:
+        # Handle marimo export errors
+        _write_command_output(log_file, e.stdout, e.stderr)
+        if _abort.is_set() and e.returncode < 0:
+            timing["error"] = "stopped after an earlier failure"
+            logger.warning(f"Stopped exporting {notebook_path} after an earlier failure")
+            return False
+        last_line: str = next((line for line in reversed((e.stderr or "").splitlines()) if line.strip()), "")
+        timing["error"] = f"exit code {e.returncode}: {last_line.strip()}"
+        logger.error(f"Error exporting {notebook_path}:")
+        logger.error(f"Command output: {e.stderr}")
+        return False
+    except Exception as e:
+        # Handle unexpected errors
+        timing["error"] = f"unexpected error: {e}"
+        logger.error(f"Unexpected error exporting {notebook_path}: {e}")
+        return False
+
+
+def _run_command(cmd: List[str], timeout: float | None = None) -> subprocess.CompletedProcess:
+    """Run a command in its own process group, so that it can be stopped as a whole.
+
+    uvx starts marimo (and uv) as child processes. If the command times out or the build
+    is stopped, the whole process group is killed, so that no child keeps running or
+    keeps the output pipes open. Once the build is stopped, no command is started at all;
+    it fails as if it had been killed.
+
+    Args:
+        cmd (List[str]): Command to run
+        timeout (float | None, optional): Seconds after which the command is killed. Defaults to None.
+
+    Returns:
+        subprocess.CompletedProcess: The finished command with its captured output
+
+    Raises:
+        subprocess.TimeoutExpired: If the command did not finish within the timeout
+        subprocess.CalledProcessError: If the command exited with a non-zero status, or the
+            build was stopped before it started
+    """
+    # Checked under the lock that _abort_on_failure kills the running processes with, so
+    # that a process is either killed with the others or not started
+    with _running_lock:
+        if _abort.is_set():
+            raise subprocess.CalledProcessError(-signal.SIGKILL, cmd, output="", stderr="")
+        process: subprocess.Popen = subprocess.Popen(
+            cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, start_new_session=True
+        )
+        _running.add(process)
+    with process:
+        try:
+            stdout, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            _kill(process)
+            stdout, stderr = process.communicate()
+            raise subprocess.TimeoutExpired(cmd, timeout, output=stdout, stderr=stderr)
+        finally:
+            with _running_lock:
+                _running.discard(process)
+
+    if process.returncode != 0:
+        raise subprocess.CalledProcessError(process.returncode, cmd, output=stdout, stderr=stderr)
+    return subprocess.CompletedProcess(cmd, process.returncode, stdout, stderr)
+
+
+def _kill(process: subprocess.Popen) -> None:
+    """Kill a process started by _run_command together with its children.
+
+    Args:
+        process (subprocess.Popen): Process to kill
+
+    Returns:
+        None
+    """
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        # Already finished
+        pass
+
+
+def _abort_on_failure(future: Future) -> None:
+    """Stop the build after the first failed export (--fail-fast).
+
+    Exports that have not started yet are skipped and running exports are killed.
+
+    Args:
+        future (Future): Finished export, as submitted by _export
+
+    Returns:
+        None
+    """
+    if future.cancelled() or future.exception() is not None or future.result():
+        return
+    if not _abort.is_set():
+        logger.error("Stopping the build after the first failure (--fail-fast)")
+        _abort.set()
+        with _running_lock:
+            for process in list(_running):
+                _kill(process)
+
+
+def _report_failures() -> int:
+    """Log a summary of the notebooks that could not be exported.
+
+    Returns:
+        int: Number of failed notebooks
+    """
+    with _timings_lock:
+        failures: List[dict] = [r for r in _timings if r["stage"] == "notebook" and not r["success"]]
+    if failures:
+        lines: List[str] = [f"  {r['notebook']}: {r.get('error', 'unknown error')}" for r in failures]
+        logger.error(f"{len(failures)} notebook(s) failed to export:\n" + "\n".join(lines))
+    return len(failures)
+
+
+def _write_command_output(log_file: Path | None, stdout: str | None, stderr: str | None) -> None:
+    """Append the captured output of the marimo command to a notebook's log file.
+
+    Args:
+        log_file (Path | None): Log file of the notebook, or None if log files are disabled
+        stdout (str | None): Captured standard output of the command
+        stderr (str | None): Captured standard error of the command
+
+    Returns:
+        None
+    """
+    if log_file is None:
+        return
+
+    with open(log_file, "a") as f:
+        f.write(f"--- stdout ---\n{stdout or ''}\n--- stderr ---\n{stderr or ''}\n")
+
+
+def _copy_file(src: Union[str, Path], dst: Union[str, Path]) -> None:
+    """Copy a file into the output directory without writing through hard links.
+
+    Files in the output may be hard links created by --fingerprint or --dedup. Writing
+    into such a file would change every linked copy, so the destination is removed first.
+
+    Args:
+        src (Union[str, Path]): File to copy
+        dst (Union[str, Path]): Destination of the copy
+
+    Returns:
+        None
+    """
+    Path(dst).unlink(missing_ok=True)
+    shutil.copy2(src, dst)
+
+
+def _write_output(path: Path, data: bytes) -> None:
+    """Write a file in the output directory without writing through hard links.
+
+    The data is written to a temporary file that then replaces the file, so that hard
+    links created by --fingerprint or --dedup keep their contents, and an interrupted
+    build does not leave a partially written file behind.
+
+    Args:
+        path (Path): File to write
+        data (bytes): Contents of the file
+
+    Returns:
+        None
+    """
+    partial: Path = path.with_name(f".{path.name}.partial")
+    partial.write_bytes(data)
+    partial.replace(path)
+
+
+def _write_timings(report_file: Path, total_seconds: float, jobs: int, slowest: int = 10) -> None:
+    """Write the timing report of the build and log a summary of the slowest notebooks.
+
+    Args:
+        report_file (Path): Path of the JSON report
+        total_seconds (float): Wall time of the whole build in seconds
+        jobs (int): Number of parallel export jobs
+        slowest (int, optional): Number of notebooks in the summary table. Defaults to 10.
+
+    Returns:
+        None
+    """
+    with _timings_lock:
+        records: List[dict] = list(_timings)
+    notebooks: List[dict] = [r for r in records if r["stage"] == "notebook"]
+    stages: List[dict] = [r for r in records if r["stage"] != "notebook"]
+
+    report: dict = {
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "total_seconds": round(total_seconds, 3),
+        "jobs": jobs,
+        "marimo_version": _marimo_version(),
+        "stages": stages,
+        "notebooks": notebooks,
+    }
+    try:
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        with open(report_file, "w") as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"Timing report written to {report_file}")
+    except IOError as e:
+        logger.error(f"Error writing timing report: {e}")
+
+    if not notebooks:
+        return
+
+    # Summary table of the notebooks that took longest
+    lines: List[str] = [f"{'wall':>8} {'env':>8} {'export':>8} {'copy':>8}  {'cache':<5}  notebook"]
+    for r in sorted(notebooks, key=lambda r: r["seconds"], reverse=True)[:slowest]:
+        lines.append(
+            f"{r['seconds']:>7.1f}s {r.get('environment', 0.0):>7.1f}s {r.get('export', 0.0):>7.1f}s "
+            f"{r.get('copy', 0.0):>7.1f}s  {r.get('cache') or '-':<5}  {r['notebook']}"
+            f"{'' if r['success'] else ' (failed)'}"
+        )
+    logger.info(f"Slowest notebooks (build took {total_seconds:.1f}s):\n" + "\n".join(lines))
+
+
+def _script_dependencies(notebook_path: Path) -> Tuple[str, List[str]]:
+    """Read the Python requirement and dependencies from a notebook's script metadata.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        Tuple[str, List[str]]: The requires-python specifier (empty if not declared) and the
+                               sorted, normalised list of dependencies
+    """
+    metadata: str = _script_metadata(notebook_path.read_text())
+    # Strip the leading "# " (or "#") from each line to get the TOML content
+    content = "".join(line[2:] if line.startswith("# ") else line[1:] for line in metadata.splitlines(keepends=True))
+    script = tomllib.loads(content) if content else {}
+
+    dependencies = sorted({dep.replace(" ", "").lower() for dep in script.get("dependencies", [])})
+    # marimo itself is needed to run the export
+    if not any(re.match(r"marimo($|[^a-z0-9_.-])", dep) for dep in dependencies):
+        dependencies.append("marimo")
+    return script.get("requires-python", ""), dependencies
+
+
+def _shared_environment(notebook_path: Path, env_dir: Path) -> Path | None:
+    """Get the shared export environment for a notebook's dependency set.
+
+    Notebooks that declare the same requires-python and dependencies share one
+    environment in <env_dir>/<hash>. The environment is created the first time it is
+    needed and kept for later builds, so that it only has to be resolved once.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        env_dir (Path): Directory of the shared export environments
+
+    Returns:
+        Path | None: Path to the environment, or None if it could not be created
+    """
+    try:
+        requires_python, dependencies = _script_dependencies(notebook_path)
+    except (OSError, tomllib.TOMLDecodeError) as e:
+        logger.warning(f"Could not read script metadata of {notebook_path}, using a sandbox: {e}")
+        return None
+
+    key: str = hashlib.sha256("\0".join([requires_python, *dependencies]).encode()).hexdigest()[:16]
+    environment: Path = env_dir / key
+
+    with _environment_locks_guard:
+        lock = _environment_locks.setdefault(key, threading.Lock())
+
+    with lock:
+        # An environment is only complete once its dependencies are installed
+        marker: Path = environment / ".complete"
+        if not marker.exists():
+            logger.info(f"Creating shared environment {key} for {notebook_path}: {', '.join(dependencies)}")
+            shutil.rmtree(environment, ignore_errors=True)
+            venv_cmd: List[str] = ["uv", "venv", "--quiet", str(environment)]
+            if requires_python:
+                venv_cmd.extend(["--python", requires_python])
+            install_cmd: List[str] = [
+                "uv", "pip", "install", "--quiet", "--python", str(environment / "bin" / "python"), *dependencies,
+            ]
+            try:
+                for cmd in (venv_cmd, install_cmd):
+                    logger.debug(f"Running command: {cmd}")
+                    _run_command(cmd)
+            except (OSError, subprocess.CalledProcessError) as e:
+                stderr = getattr(e, "stderr", None) or e
+                logger.warning(f"Could not create shared environment {key}, using a sandbox: {stderr}")
+                shutil.rmtree(environment, ignore_errors=True)
+                return None
+            marker.touch()
+            _environments_created.append(key)
+        else:
+            logger.debug(f"Reusing shared environment {key} for {notebook_path}")
+
+        _environments_used[key] = _environments_used.get(key, 0) + 1
+
+    return environment
+
+
+@functools.cache
+def _marimo_version(environment: Path | None = None) -> str:
+    """Return the version of marimo that is used to export the notebooks.
+
+    The version is part of the cache key, because the exported HTML and runtime assets
+    change with every marimo release. Shared environments keep the marimo version they
+    were created with, which can be older than the one that uvx runs in a sandbox.
+
+    Args:
+        environment (Path | None, optional): Shared export environment, or None for the
+                                             marimo that uvx runs. Defaults to None.
+
+    Returns:
+        str: Output of `marimo --version`, or "unknown" if it could not be determined
+    """
+    if environment is not None:
+        cmd: List[str] = [str(environment / "bin" / "marimo"), "--version"]
+    else:
+        cmd: List[str] = ["uvx", "marimo", "--version"]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError) as e:
+        logger.warning(f"Could not determine marimo version: {e}")
+        return "unknown"
+
+
+def _script_metadata(source: str) -> str:
+    """Extract the PEP 723 inline script metadata (# /// script) from a notebook.
+
+    Args:
+        source (str): Source code of the notebook
+
+    Returns:
+        str: Content of the script metadata block, or an empty string if there is none
+    """
+    match = _SCRIPT_METADATA.search(source)
+    return match.group("content") if match else ""
+
+
+@functools.cache
+def _public_digest(folder: Path) -> str:
+    """Hash the public/ folder next to a notebook, which marimo copies into the export.
+
+    Args:
+        folder (Path): Folder containing the notebook
+
+    Returns:
+        str: Hex digest of the names and contents of all files in <folder>/public
+    """
+    digest = hashlib.sha256()
+    public: Path = folder / "public"
+    if public.is_dir():
+        for path in sorted(p for p in public.rglob("*") if p.is_file()):
+            digest.update(str(path.relative_to(public)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+@functools.cache
+def _modules_digest(folder: Path) -> str:
+    """Hash the Python modules next to a notebook, which marimo bundles into the export if the notebook imports them.
+
+    Args:
+        folder (Path): Folder containing the notebook
+
+    Returns:
+        str: Hex digest of the names and contents of the Python files under the folder that are not notebooks
+    """
+    digest = hashlib.sha256()
+    for path in _python_files(folder):
+        if not _is_notebook(path):
+            digest.update(str(path.relative_to(folder)).encode())
+            digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def _cache_key(notebook_path: Path, as_app: bool, environment: Path | None = None) -> str:
+    """Compute the content-addressed cache key of a notebook export.
+
+    The key covers everything that determines the exported files: the notebook source,
+    its PEP 723 dependency header, the export mode, the marimo version that exports it,
+    the public/ folder that is copied along with the notebook and the local modules that
+    are bundled with it.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+        as_app (bool): Whether the notebook is exported as an app (run mode) or notebook (edit mode)
+        environment (Path | None, optional): Shared environment that exports the notebook, or
+                                             None for a sandbox. Defaults to None.
+
+    Returns:
+        str: Hex digest identifying the export
+    """
+    source: str = notebook_path.read_text()
+    digest = hashlib.sha256()
+    for part in (
+        str(notebook_path),
+        source,
+        _script_metadata(source),
+        "app" if as_app else "notebook",
+        _marimo_version(environment),
+        _public_digest(notebook_path.parent),
+        _modules_digest(notebook_path.parent),
+    ):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+def _store_in_cache(staging: Path, cache_entry: Path) -> None:
+    """Store a staged export in the cache.
+
+    The export is copied to a temporary directory first and then renamed, so that an
+    interrupted build never leaves a partial cache entry behind.
+
+    Args:
+        staging (Path): Staging directory containing the exported notebook and its assets
+        cache_entry (Path): Cache entry in which to store the export
+
+    Returns:
+        None
+    """
+    cache_entry.parent.mkdir(parents=True, exist_ok=True)
+    partial: Path = cache_entry.with_name(f"{cache_entry.name}.partial-{threading.get_ident()}")
+    try:
+        shutil.copytree(staging, partial)
+        partial.rename(cache_entry)
+    except OSError as e:
+        # A failing cache must never fail the build
+        logger.warning(f"Could not store export in cache: {e}")
+        shutil.rmtree(partial, ignore_errors=True)
+
+
+def _restore_from_cache(cache_entry: Path, destination: Path) -> bool:
+    """Copy a cached export into the output directory.
+
+    Args:
+        cache_entry (Path): Cache entry containing the exported notebook and its assets
+        destination (Path): Output folder of the notebook
+
+    Returns:
+        bool: True if the export was restored, False if it is not in the cache
+    """
+    if not cache_entry.is_dir():
+        return False
+
+    with _merge_lock:
+        shutil.copytree(cache_entry, destination, copy_function=_copy_file, dirs_exist_ok=True)
+
+    # Mark the entry as recently used for the eviction policy
+    os.utime(cache_entry)
+    return True
+
+
+def _evict_cache(cache_dir: Path, max_size_mb: int) -> None:
+    """Remove the least recently used cache entries until the cache fits its size limit.
+
+    Args:
+        cache_dir (Path): Directory of the export cache
+        max_size_mb (int): Maximum size of the cache in megabytes
+
+    Returns:
+        None
+    """
+    if not cache_dir.is_dir():
+        return
+
+    entries = []
+    for entry in cache_dir.iterdir():
+        if not entry.is_dir():
+            continue
+        if ".partial-" in entry.name:
+            # Leftover from an interrupted build
+            shutil.rmtree(entry, ignore_errors=True)
+            continue
+        size = sum(p.stat().st_size for p in entry.rglob("*") if p.is_file())
+        entries.append((entry.stat().st_mtime, size, entry))
+
+    total: int = sum(size for _, size, _ in entries)
+    limit: int = max_size_mb * 1024 * 1024
+    remaining: int = len(entries)
+    for _, size, entry in sorted(entries, key=lambda e: e[0]):
+        if total <= limit:
+            break
+        logger.debug(f"Evicting cache entry {entry.name}")
+        shutil.rmtree(entry, ignore_errors=True)
+        total -= size
+        remaining -= 1
+
+    logger.info(f"Export cache: {remaining} entries, {total / 1024 / 1024:.1f} MB (limit {max_size_mb} MB)")
+
+
+def _fingerprint_assets(output_dir: Path) -> Dict[str, str]:
+    """Add content-hashed copies of the public/ assets and point the exports at them.
+
+    Every file in a public/ folder of the output gets a sibling named
+    <name>.<hash>.<suffix>. Literal references to the asset in the exported HTML files of
+    the same folder are rewritten to the fingerprinted name, so that the asset can be
+    served with a far-future cache lifetime. The original files are kept, because
+    notebooks may also build asset paths at runtime (e.g. mo.notebook_location()).
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+
+    Returns:
+        Dict[str, str]: Manifest mapping each asset path to its fingerprinted path,
+                        relative to the output directory
+    """
+    manifest: Dict[str, str] = {}
+    for public in sorted(p for p in output_dir.rglob("public") if p.is_dir()):
+        renames: Dict[str, str] = {}
+        for asset in sorted(p for p in public.rglob("*") if p.is_file()):
+            # Skip fingerprinted copies and compressed siblings of earlier builds
+            if re.search(r"\.[0-9a-f]{10}$", asset.stem) or asset.suffix in {".gz", ".br"}:
+                continue
+            # Wheels of bundled local modules carry a content hash already, and must keep their names to install
+            if asset.suffix == ".whl":
+                continue
+
+            digest: str = hashlib.sha256(asset.read_bytes()).hexdigest()[:10]
+            fingerprinted: Path = asset.with_name(f"{asset.stem}.{digest}{asset.suffix}")
+            if not fingerprinted.exists():
+                try:
+                    # A hard link avoids storing the asset twice
+                    os.link(asset, fingerprinted)
+                except OSError:
+                    shutil.copy2(asset, fingerprinted)
+
+            renames[str(asset.relative_to(public.parent))] = str(fingerprinted.relative_to(public.parent))
+            manifest[str(asset.relative_to(output_dir))] = str(fingerprinted.relative_to(output_dir))
+
+        if not renames:
+            continue
+
+        # Rewrite literal references such as "public/logo.png" in the exports next to public/
+        pattern = re.compile(
+            r"(?<![\w-])(" + "|".join(re.escape(name) for name in sorted(renames, key=len, reverse=True)) + r")(?![\w.-])"
+        )
+        for html_file in public.parent.glob("*.html"):
+            html: str = html_file.read_text()
+            rewritten, count = pattern.subn(lambda m: renames[m.group(1)], html)
+            if count:
+                logger.debug(f"Rewrote {count} asset reference(s) in {html_file}")
+                html_file.write_text(rewritten)
+
+    manifest_file: Path = output_dir / "asset-manifest.json"
+    with open(manifest_file, "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    logger.info(f"Fingerprinted {len(manifest)} asset(s), manifest written to {manifest_file}")
+    return manifest
+
+
+def _link_or_copy(src: Path, dst: Path) -> None:
+    """Replace a file with a hard link to another file, or a copy if linking is not possible.
+
+    Args:
+        src (Path): File to link to
+        dst (Path): File to replace
+
+    Returns:
+        None
+    """
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def _hoist_assets(output_dir: Path, shared_dir: Path) -> int:
+    """Move the marimo runtime assets of all exported folders into one shared folder.
+
+    marimo names its runtime assets by content hash (e.g. assets/session-DXKMv4Bs.js), and
+    the assets import each other by relative path. The assets/ folders of all exports are
+    therefore merged into <shared_dir>/assets as a whole, and the references in the
+    exported HTML files are rewritten to point there. A folder is left in place if one of
+    its assets conflicts with a different file of the same name in the shared folder.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        shared_dir (Path): Shared folder inside the output directory
+
+    Returns:
+        int: Number of bytes saved by removing duplicate assets
+    """
+    saved: int = 0
+    shared_assets: Path = shared_dir / "assets"
+    for assets in sorted(p for p in output_dir.rglob("assets") if p.is_dir() and not p.is_relative_to(shared_dir)):
+        html_files: List[Path] = sorted(assets.parent.glob("*.html"))
+        if not html_files:
+            continue
+
+        files: List[Path] = [p for p in assets.rglob("*") if p.is_file()]
+        conflicts: List[Path] = [
+            p for p in files
+            if (shared_assets / p.relative_to(assets)).exists()
+            and not filecmp.cmp(p, shared_assets / p.relative_to(assets), shallow=False)
+        ]
+        if conflicts:
+            logger.warning(f"Keeping {assets} in place, {len(conflicts)} asset(s) differ from {shared_assets}")
+            continue
+
+        for path in files:
+            target: Path = shared_assets / path.relative_to(assets)
+            if target.exists():
+                saved += path.stat().st_size
+                path.unlink()
+            else:
+                target.parent.mkdir(parents=True, exist_ok=True)
+                path.rename(target)
+        shutil.rmtree(assets)
+
+        # Point the exported notebooks at the shared assets
+        prefix: str = os.path.relpath(shared_assets, assets.parent)
+        for html_file in html_files:
+            html: str = html_file.read_text()
+            html_file.write_text(re.sub(r"(?<=[\"'(])(\./)?assets/", f"{prefix}/", html))
+        logger.debug(f"Moved {assets} to {shared_assets}")
+
+    return saved
+
+
+def _dedup_output(output_dir: Path, mode: str = "hardlink") -> int:
+    """Store byte-identical files across the exported folders only once.
+
+    Every group of identical files is hoisted into the content-addressed folder
+    <output_dir>/_shared as <hash><suffix>, and the copies are replaced by hard links to it,
+    so that all paths keep working. In "rewrite" mode, the marimo runtime assets are
+    first moved to <output_dir>/_shared/assets and the exports are rewritten to load them
+    from there, so that browsers can reuse cached assets across notebooks.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        mode (str, optional): "hardlink" or "rewrite". Defaults to "hardlink".
+
+    Returns:
+        int: Number of bytes saved
+    """
+    if mode not in ("hardlink", "rewrite"):
+        raise ValueError(f"Unknown dedup mode: {mode} (expected 'hardlink' or 'rewrite')")
+
+    shared_dir: Path = output_dir / "_shared"
+    saved: int = _hoist_assets(output_dir, shared_dir) if mode == "rewrite" else 0
+
+    # Entry points, manifests and compressed siblings are specific to each folder
+    candidates: List[Path] = [
+        p for p in output_dir.rglob("*")
+        if p.is_file()
+        and not p.is_relative_to(shared_dir)
+        and p.suffix not in {".html", ".gz", ".br"}
+        and p.name != "asset-manifest.json"
+    ]
+
+    # Only files of equal size can be identical, so only those are hashed
+    by_size: Dict[int, List[Path]] = {}
+    for path in candidates:
+        by_size.setdefault(path.stat().st_size, []).append(path)
+
+    groups: Dict[str, List[Path]] = {}
+    for size, paths in by_size.items():
+        if len(paths) < 2 or size == 0:
+            continue
+        for path in paths:
+            digest: str = hashlib.sha256(path.read_bytes()).hexdigest()
+            groups.setdefault(f"{digest[:16]}{path.suffix}", []).append(path)
+
+    for name, paths in groups.items():
+        # Files that are already hard links to the same data do not take extra space
+        inodes = {(p.stat().st_dev, p.stat().st_ino) for p in paths}
+        if len(inodes) < 2:
+            continue
+
+        shared: Path = shared_dir / name
+        if not shared.exists():
+            shared.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy2(paths[0], shared)
+        for path in paths:
+            if not path.samefile(shared):
+                _link_or_copy(shared, path)
+        saved += (len(inodes) - 1) * paths[0].stat().st_size
+
+    logger.info(f"Deduplicated output ({mode}): saved {saved / 1024 / 1024:.1f} MB")
+    return saved
+
+
+def _compress_file(path: Path, min_ratio: float = 0.95) -> Tuple[int, int, int]:
+    """Write precompressed .gz and .br siblings of a file.
+
+    A sibling is only kept if it is noticeably smaller than the original file. Siblings
+    from an earlier build are reused if they still decompress to the contents of the file;
+    modification times are not enough, because copies and cache restores keep the
+    modification time of older contents.
+
+    Args:
+        path (Path): File to compress
+        min_ratio (float, optional): Maximum ratio of compressed to original size for a
+                                     sibling to be kept. Defaults to 0.95.
+
+    Returns:
+        Tuple[int, int, int]: Size of the original, the gzip sibling and the brotli sibling
+                              (the original size if a sibling was not written)
+    """
+    data: bytes = path.read_bytes()
+
+    def write(suffix: str, encode, decode) -> int:
+        sibling: Path = path.with_name(path.name + suffix)
+        if encode is None:
+            sibling.unlink(missing_ok=True)
+            return len(data)
+        # Decompressing is much faster than compressing again, especially for brotli
+        if sibling.exists():
+            try:
+                if decode(sibling.read_bytes()) == data:
+                    return sibling.stat().st_size
+            except Exception as e:
+                logger.debug(f"Compressing {path} again, as {sibling} can not be decompressed: {e}")
+        compressed: bytes = encode(data)
+        if len(compressed) > min_ratio * len(data):
+            sibling.unlink(missing_ok=True)
+            return len(data)
+        # A new file instead of writing in place, as the sibling may be a hard link (--dedup)
+        partial: Path = sibling.with_name(sibling.name + ".partial")
+        partial.write_bytes(compressed)
+        partial.replace(sibling)
+        return len(compressed)
+
+    # mtime=0 keeps the gzip output reproducible
+    gz_size: int = write(".gz", lambda d: gzip.compress(d, compresslevel=9, mtime=0), gzip.decompress)
+    if brotli is not None:
+        br_size: int = write(".br", lambda d: brotli.compress(d, quality=11), brotli.decompress)
+    else:
+        br_size: int = write(".br", None, None)
+    return len(data), gz_size, br_size
+
+
+def _compress_output(output_dir: Path, jobs: int = 1, min_size: int = 1024) -> None:
+    """Write precompressed .gz and .br siblings for all compressible files in the output.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        jobs (int, optional): Number of files to compress in parallel. Defaults to 1.
+        min_size (int, optional): Minimum size in bytes of a file to be compressed. Defaults to 1024.
+
+    Returns:
+        None
+    """
+    if brotli is None:
+        logger.warning("brotli is not installed, only writing .gz files")
+
+    files: List[Path] = sorted(
+        p for p in output_dir.rglob("*")
+        if p.is_file() and p.suffix in _COMPRESSIBLE_SUFFIXES and p.stat().st_size >= min_size
+    )
+
+    # Hard links (from --fingerprint or --dedup) share their data, so only one of them is
+    # compressed and the other links share its compressed siblings
+    linked: Dict[Tuple[int, int], List[Path]] = {}
+    for path in files:
+        stat = path.stat()
+        linked.setdefault((stat.st_dev, stat.st_ino), []).append(path)
+    originals: List[Path] = [paths[0] for paths in linked.values()]
+
+    # zlib and brotli release the GIL, so threads compress in parallel
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        sizes = list(executor.map(_compress_file, originals))
+
+    for paths in linked.values():
+        for suffix in (".gz", ".br"):
+            sibling: Path = paths[0].with_name(paths[0].name + suffix)
+            for path in paths[1:]:
+                if sibling.exists():
+                    _link_or_copy(sibling, path.with_name(path.name + suffix))
+                else:
+                    path.with_name(path.name + suffix).unlink(missing_ok=True)
+
+    original, gz, br = (sum(column) for column in zip(*sizes)) if sizes else (0, 0, 0)
+    mb = 1024 * 1024
+    logger.info(
+        f"Compressed {len(originals)} file(s): {original / mb:.1f} MB -> {gz / mb:.1f} MB gzip"
+        + (f", {br / mb:.1f} MB brotli" if brotli is not None else "")
+    )
+
+
+def _compact_folder(folder: Path) -> int:
+    """Write compact copies of the GPX files in a folder and a manifest describing them.
+
+    Every <name>.gpx gets a sibling <name>.bin with columns of little-endian int32 values,
+    one after the other: the latitudes and longitudes of its points in microdegrees and,
+    if every point has them, the elevations in decimetres and the times in seconds since
+    the start of the track. Each column is delta-encoded (the first value is absolute,
+    every next value is the difference to the previous one), and the manifest lists the
+    columns with their scales.
+    manifest.json lists the name, number of points, length, centre and bounding box of
+    every track, so that the apps can list and summarise the archive without reading it,
+    the hash of every GPX file, so that the apps can cache parsed tracks, and the cells of
+    a grid of GRID_CELL degrees that every track passes through, so that the apps can
+    find the tracks in an area without building a spatial index.
+    The GPX files are read, and the lengths and grid cells computed, with the code of
+    apps/gpx_trails.py, so that the manifest matches what the apps compute themselves.
+
+    Args:
+        folder (Path): Folder with GPX files
+
+    Returns:
+        int: Number of tracks written
+    """
+    # Imported here, so that only builds with GPX files need numpy and the apps' module
+    if str(_APPS_DIR) not in sys.path:
+        sys.path.insert(0, str(_APPS_DIR))
+    import numpy as np
+    from gpx_trails import COMPACT_VERSION, GRID_CELL, grid_cells, haversine, read_points
+
+    entries: List[dict] = []
+    for gpx_file in sorted(folder.glob("*.gpx")):
+        # Skip fingerprinted copies of earlier builds
+        if re.search(r"\.[0-9a-f]{10}$", gpx_file.stem):
+            continue
+        try:
+            name, points, times, elevation = read_points(gpx_file)
+        except (ElementTree.ParseError, KeyError, ValueError) as e:
+            logger.warning(f"Skipping {gpx_file}, it can not be read as a track: {e}")
+            continue
 
-import subprocess
-from typing import List, Union
-from pathlib import Path
+        # Quantise first, so that the summary matches the decoded track
+        columns: Dict[str, np.ndarray] = {
+            "lat": np.round(points[:, 0] * _TRACK_SCALES["lat"]).astype(np.int64),
+            "lon": np.round(points[:, 1] * _TRACK_SCALES["lon"]).astype(np.int64),
+        }
+        if elevation is not None:
+            columns["ele"] = np.round(elevation * _TRACK_SCALES["ele"]).astype(np.int64)
+        if times is not None:
+            seconds: np.ndarray = (times - times[0]) / np.timedelta64(1, "s")
+            columns["time"] = np.round(seconds * _TRACK_SCALES["time"]).astype(np.int64)
 
-import jinja2
-import fire
+        # Every column is stored as its first value and the differences between the next ones
+        deltas: np.ndarray = np.concatenate([np.diff(column, prepend=0) for column in columns.values()])
+        if np.abs(deltas).max() >= 2**31:
+            logger.warning(f"Skipping {gpx_file}, its values do not fit the compact format")
+            continue
+        _write_output(gpx_file.with_suffix(".bin"), deltas.astype("<i4").tobytes())
 
-from loguru import logger
+        lats, lons = columns["lat"], columns["lon"]
+        # Latitude and longitude share a scale
+        scale: int = _TRACK_SCALES["lat"]
+        track: np.ndarray = np.column_stack((lats, lons)) / scale
+        entries.append(
+            {
+                "file": gpx_file.name,
+                "data": gpx_file.with_suffix(".bin").name,
+                "sha256": hashlib.sha256(gpx_file.read_bytes()).hexdigest(),
+                "name": name or gpx_file.stem,
+                "points": len(track),
+                "length": round(float(haversine(track).sum()), 1),
+                "centre": track.mean(axis=0).tolist(),
+                # (south, west, north, east)
+                "bbox": [*track.min(axis=0).tolist(), *track.max(axis=0).tolist()],
+                "columns": list(columns),
+                "scales": [_TRACK_SCALES[column] for column in columns],
+                # Time of the first point, in seconds since the epoch
+                "start": float(times[0].astype(np.int64)) / 1_000 if times is not None else None,
+                "cells": grid_cells(track).tolist(),
+            }
+        )
 
-def _export_html_wasm(notebook_path: Path, output_dir: Path, as_app: bool = False) -> bool:
-    """Export a single marimo notebook to HTML/WebAssembly format.
+    manifest: dict = {"version": COMPACT_VERSION, "cell": GRID_CELL, "trails": entries}
+    # Compact, as the grid cells make up most of the manifest
+    _write_output(folder / "manifest.json", json.dumps(manifest, separators=(",", ":")).encode())
+    return len(entries)
 
-    This function takes a marimo notebook (.py file) and exports it to HTML/WebAssembly format.
-    If as_app is True, the notebook is exported in "run" mode with code hidden, suitable for
-    applications. Otherwise, it's exported in "edit" mode, suitable for interactive notebooks.
+
+def _compact_tracks(output_dir: Path) -> int:
+    """Write compact copies of the GPX files in all public/ folders of the output.
 
     Args:
-        notebook_path (Path): Path to the marimo notebook (.py file) to export
-        output_dir (Path): Directory where the exported HTML file will be saved
-        as_app (bool, optional): Whether to export as an app (run mode) or notebook (edit mode).
-                                Defaults to False.
+        output_dir (Path): Directory where the exported files are saved
 
     Returns:
-        bool: True if export succeeded, False otherwise
+        int: Number of tracks written
     """
-    # Convert .py extension to .html for the output file
-    output_path: Path = notebook_path.with_suffix(".html")
+    folders: List[Path] = sorted(
+        {p.parent for p in output_dir.rglob("*.gpx") if "public" in p.relative_to(output_dir).parts}
+    )
+    count: int = sum(_compact_folder(folder) for folder in folders)
+    if folders:
+        logger.info(f"Wrote {count} compact track(s) in {len(folders)} folder(s)")
+    return count
 
-    # Base command for marimo export
-    cmd: List[str] = ["uvx", "marimo", "export", "html-wasm", "--sandbox"]
 
-    # Configure export mode based on whether it's an app or a notebook
-    if as_app:
-        logger.info(f"Exporting {notebook_path} to {output_path} as app")
-        cmd.extend(["--mode", "run", "--no-show-code"])  # Apps run in "run" mode with hidden code
-    else:
-        logger.info(f"Exporting {notebook_path} to {output_path} as notebook")
-        cmd.extend(["--mode", "edit"])  # Notebooks run in "edit" mode
+def _tile_slug(provider: str) -> str:
+    """Folder name of the tiles of a map style, e.g. "openstreetmap-mapnik".
 
-    try:
-        # Create full output path and ensure directory exists
-        output_file: Path = output_dir / notebook_path.with_suffix(".html")
-        output_file.parent.mkdir(parents=True, exist_ok=True)
+    Args:
+        provider (str): Name of the map style in the apps
 
-        # Add notebook path and output file to command
-        cmd.extend([str(notebook_path), "-o", str(output_file)])
+    Returns:
+        str: Lowercase name with dashes instead of spaces and punctuation
+    """
+    return re.sub(r"[^a-z0-9]+", "-", provider.lower()).strip("-")
 
-        # Run marimo export command
-        logger.debug(f"Running command: {cmd}")
-        subprocess.run(cmd, capture_output=True, text=True, check=True)
-        logger.info(f"Successfully exported {notebook_path}")
+
+def _tile_range(bbox: List[float], zoom: int) -> Tuple[int, int, int, int]:
+    """Web Mercator tiles that cover a bounding box at a zoom level.
+
+    Args:
+        bbox (List[float]): South, west, north and east of the bounding box in degrees
+        zoom (int): Zoom level
+
+    Returns:
+        Tuple[int, int, int, int]: First and last column (x) and first and last row (y)
+    """
+    south, west, north, east = bbox
+    n: int = 2**zoom
+
+    def column(lon: float) -> int:
+        return min(n - 1, max(0, int((lon + 180) / 360 * n)))
+
+    def row(lat: float) -> int:
+        lat = math.radians(max(-85.0511, min(85.0511, lat)))
+        return min(n - 1, max(0, int((1 - math.asinh(math.tan(lat)) / math.pi) / 2 * n)))
+
+    return column(west), column(east), row(north), row(south)
+
+
+def _fetch_tile(url: str, target: Path, timeout: float = 30) -> bool:
+    """Download a single tile, unless it was downloaded before.
+
+    Args:
+        url (str): URL of the tile
+        target (Path): File to write the tile to
+        timeout (float, optional): Seconds to wait for the tile server. Defaults to 30.
+
+    Returns:
+        bool: Whether the tile is available in the target file
+    """
+    if target.exists():
         return True
-    except subprocess.CalledProcessError as e:
-        # Handle marimo export errors
-        logger.error(f"Error exporting {notebook_path}:")
-        logger.error(f"Command output: {e.stderr}")
-        return False
-    except Exception as e:
-        # Handle unexpected errors
-        logger.error(f"Unexpected error exporting {notebook_path}: {e}")
+    # Tile servers refuse requests without an identifying user agent
+    request = urllib.request.Request(url, headers={"User-Agent": "marimo-playground build script"})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as response:
+            data: bytes = response.read()
+    except (urllib.error.URLError, OSError) as e:
+        logger.debug(f"Failed to download tile {url}: {e}")
         return False
+    target.parent.mkdir(parents=True, exist_ok=True)
+    # Write under a temporary name first, so an interrupted build does not leave a broken tile
+    partial: Path = target.with_name(f".{target.name}.partial")
+    partial.write_bytes(data)
+    partial.replace(target)
+    return True
+
+
+def _prefetch_tiles(
+    output_dir: Path,
+    cache_dir: Path,
+    url: str,
+    provider: str = "Stadia Outdoors",
+    zooms: Tuple[int, int] = (8, 13),
+) -> int:
+    """Download the map tiles around the tracks of all public/ folders for offline use.
+
+    The tiles that cover the bounding box of every track in a manifest.json are downloaded
+    into the cache directory, so that later builds only download tiles of new tracks, and
+    are linked into public/tiles/<style>/{z}/{x}/{y}.png next to the tracks. A tiles.json
+    in that folder tells the apps which zoom levels and area the tiles cover, and
+    public/tiles/styles.json lists the map styles whose tiles were prefetched.
+
+    Args:
+        output_dir (Path): Directory where the exported files are saved
+        cache_dir (Path): Directory where downloaded tiles are kept between builds
+        url (str): URL template of the tiles with {z}, {x} and {y}, e.g. of the tile_server
+                   command or of a tile server that allows bulk downloads
+        provider (str, optional): Map style of the apps. Defaults to "Stadia Outdoors".
+        zooms (Tuple[int, int], optional): Lowest and highest zoom level. Defaults to (8, 13).
+
+    Returns:
+        int: Number of tiles in the output
+    """
+    if provider not in _TILE_PROVIDERS:
+        raise ValueError(f"Unknown map style {provider!r}, choose one of {', '.join(_TILE_PROVIDERS)}")
+    attribution: str = _TILE_PROVIDERS[provider]
+    slug: str = _tile_slug(provider)
+
+    # Bounding boxes of the tracks, by the public/ folder they belong to
+    boxes: Dict[Path, List[List[float]]] = {}
+    for manifest_file in output_dir.rglob("manifest.json"):
+        parts = manifest_file.relative_to(output_dir).parts
+        if "public" not in parts:
+            continue
+        public: Path = output_dir.joinpath(*parts[: parts.index("public") + 1])
+        trails: List[dict] = json.loads(manifest_file.read_text()).get("trails", [])
+        boxes.setdefault(public, []).extend(trail["bbox"] for trail in trails)
+
+    total: int = 0
+    for public, bboxes in boxes.items():
+        tiles: set = set()
+        for bbox in bboxes:
+            for zoom in range(zooms[0], zooms[1] + 1):
+                x0, x1, y0, y1 = _tile_range(bbox, zoom)
+                tiles.update((zoom, x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+
+        # Download the missing tiles into the cache, then link them into the output
+        def fetch(tile: Tuple[int, int, int]) -> Tuple[Tuple[int, int, int], bool]:
+            z, x, y = tile
+            return tile, _fetch_tile(url.format(z=z, x=x, y=y), cache_dir / slug / f"{z}/{x}/{y}.png")
+
+        available: List[Tuple[int, int, int]] = []
+        with ThreadPoolExecutor(max_workers=_TILE_CONNECTIONS) as executor:
+            for tile, ok in executor.map(fetch, sorted(tiles)):
+                if ok:
+                    available.append(tile)
+        if len(available) < len(tiles):
+            logger.warning(f"Failed to download {len(tiles) - len(available)} of {len(tiles)} {provider} tiles")
+
+        for z, x, y in available:
+            target: Path = public / "tiles" / slug / f"{z}/{x}/{y}.png"
+            target.parent.mkdir(parents=True, exist_ok=True)
+            _link_or_copy(cache_dir / slug / f"{z}/{x}/{y}.png", target)
+        south, west, north, east = zip(*bboxes)
+        info: dict = {
+            "provider": provider,
+            "attribution": attribution,
+            "min_zoom": zooms[0],
+            "max_zoom": zooms[1],
+            # (south, west, north, east) of all tracks
+            "bounds": [min(south), min(west), max(north), max(east)],
+        }
+        _write_output(public / "tiles" / slug / "tiles.json", json.dumps(info).encode())
+        # Every map style with prefetched tiles in this folder, so that the apps can start with one of them
+        styles: List[str] = sorted(
+            json.loads((style_dir / "tiles.json").read_text())["provider"]
+            for style_dir in (public / "tiles").iterdir()
+            if (style_dir / "tiles.json").is_file()
+        )
+        _write_output(public / "tiles" / "styles.json", json.dumps(styles).encode())
+        total += len(available)
+        logger.info(f"Prefetched {len(available)} {provider} tile(s) for {len(bboxes)} track(s) in {public}")
+    return total
+
+
+def _placeholder_tile(z: int, x: int, y: int) -> bytes:
+    """A plain grey 256x256 PNG tile, lighter and darker in a checkerboard of tiles.
+
+    Args:
+        z (int): Zoom level
+        x (int): Column
+        y (int): Row
+
+    Returns:
+        bytes: PNG image
+    """
+    shade: int = 225 if (x + y) % 2 else 240
+
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    # 8-bit greyscale, every row starts with filter type 0
+    pixels: bytes = (b"\x00" + bytes([shade]) * 256) * 256
+    return (
+        b"\x89PNG\r\n\x1a\n"
+        + chunk(b"IHDR", struct.pack(">IIBBBBB", 256, 256, 8, 0, 0, 0, 0))
+        + chunk(b"IDAT", zlib.compress(pixels, 9))
+        + chunk(b"IEND", b"")
+    )
+
+
+def _tile_server(directory: Path | None = None, host: str = "127.0.0.1", port: int = 8700) -> ThreadingHTTPServer:
+    """Create the HTTP server of the tile_server command, without starting it.
+
+    Args:
+        directory (Path | None, optional): Folder with tiles in {z}/{x}/{y}.png, or None to
+                                           serve placeholders only. Defaults to None.
+        host (str, optional): Address to listen on. Defaults to "127.0.0.1".
+        port (int, optional): Port to listen on, or 0 for any free port. Defaults to 8700.
+
+    Returns:
+        ThreadingHTTPServer: The server, bound to its address
+    """
+    tile_path = re.compile(r"^/(\d+)/(\d+)/(\d+)\.png$")
+
+    class TileHandler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            match = tile_path.match(self.path.split("?")[0])
+            if not match:
+                self.send_error(404)
+                return
+            z, x, y = map(int, match.groups())
+            stored: Path | None = directory / f"{z}/{x}/{y}.png" if directory else None
+            body: bytes = stored.read_bytes() if stored and stored.is_file() else _placeholder_tile(z, x, y)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args) -> None:
+            logger.debug(format % args)
+
+    return ThreadingHTTPServer((host, port), TileHandler)
+
+
+def tile_server(directory: Union[str, Path, None] = None, host: str = "127.0.0.1", port: int = 8700) -> None:
+    """Serve map tiles locally, as a stand-in for a tile provider in tests and offline demos.
+
+    Tiles are served at http://<host>:<port>/{z}/{x}/{y}.png, from the directory if it has
+    the tile and as a plain grey placeholder otherwise. Point the build at it with
+    --tile-url "http://127.0.0.1:8700/{z}/{x}/{y}.png" to prefetch tiles without the network.
+
+    Command line arguments:
+        --directory: Folder with tiles in {z}/{x}/{y}.png, e.g. _build/tiles/openstreetmap-mapnik
+                     (default: None, only placeholders)
+        --host: Address to listen on (default: 127.0.0.1)
+        --port: Port to listen on (default: 8700)
+
+    Returns:
+        None
+    """
+    server: ThreadingHTTPServer = _tile_server(Path(directory) if directory else None, host, port)
+    logger.info(f"Serving tiles at http://{host}:{server.server_port}/{{z}}/{{x}}/{{y}}.png (press Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Stopped serving tiles")
+    finally:
+        server.server_close()
+
+
+def _write_catalog(output_dir: Path, notebooks_data: List[dict], apps_data: List[dict]) -> Path:
+    """Write a JSON catalog of all exported notebooks and apps.
+
+    The catalog lets the index page search and paginate the collection without having
+    every notebook inlined into index.html.
+
+    Args:
+        output_dir (Path): Directory where the catalog.json file will be saved
+        notebooks_data (List[dict]): List of dictionaries with data for notebooks
+        apps_data (List[dict]): List of dictionaries with data for apps
+
+    Returns:
+        Path: Path to the catalog file
+    """
+    catalog: List[dict] = []
+    for mode, items in (("notebook", notebooks_data), ("app", apps_data)):
+        for item in items:
+            html_file: Path = output_dir / item["html_path"]
+            source: Path = Path(item["html_path"]).with_suffix(".py")
+            stat = html_file.stat() if html_file.exists() else None
+            modified: float | None = source.stat().st_mtime if source.exists() else stat and stat.st_mtime
+            catalog.append(
+                {
+                    "name": item["display_name"],
+                    "path": item["html_path"],
+                    "mode": mode,
+                    "size": stat.st_size if stat else None,
+                    "modified": (
+                        datetime.fromtimestamp(modified, timezone.utc).isoformat(timespec="seconds") if modified else None
+                    ),
+                }
+            )
+
+    catalog_path: Path = output_dir / "catalog.json"
+    with open(catalog_path, "w") as f:
+        json.dump(catalog, f, separators=(",", ":"))
+    return catalog_path
 
 
 def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[dict] | None = None, apps_data: List[dict] | None = None) -> None:
@@ -88,7 +1635,10 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
 
     This function creates an HTML index page that displays links to all the exported
     notebooks. The index page includes the marimo logo and displays each notebook
-    with a formatted title and a link to open it.
+    with a formatted title and a link to open it. A catalog.json file with all
+    notebooks and apps is written next to it, from which the page can load the rest of
+    a large collection. The template is rendered as a stream, so the page is never held
+    in memory as a whole.
 
     Args:
         notebooks_data (List[dict]): List of dictionaries with data for notebooks
@@ -107,7 +1657,14 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
     # Ensure the output directory exists
     output_dir.mkdir(parents=True, exist_ok=True)
 
+    notebooks_data = notebooks_data or []
+    apps_data = apps_data or []
+
     try:
+        # Write the catalog that the index page loads lazily
+        with _timed("catalog", entries=len(notebooks_data) + len(apps_data)):
+            catalog_path: Path = _write_catalog(output_dir, notebooks_data, apps_data)
+
         # Set up Jinja2 environment and load template
         template_dir = template_file.parent
         template_name = template_file.name
@@ -117,12 +1674,16 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
         )
         template = env.get_template(template_name)
 
-        # Render the template with notebook and app data
-        rendered_html = template.render(notebooks=notebooks_data, apps=apps_data)
-
-        # Write the rendered HTML to the index.html file
-        with open(index_path, "w") as f:
-            f.write(rendered_html)
+        with _timed("index", template=str(template_file)):
+            # Render the template with notebook and app data, writing it chunk by chunk
+            with open(index_path, "w") as f:
+                for chunk in template.generate(
+                    notebooks=notebooks_data,
+                    apps=apps_data,
+                    catalog_url=catalog_path.name,
+                    page_size=_INDEX_PAGE_SIZE,
+                ):
+                    f.write(chunk)
         logger.info(f"Successfully generated index.html at {index_path}")
 
     except IOError as e:
@@ -133,51 +1694,206 @@ def _generate_index(output_dir: Path, template_file: Path, notebooks_data: List[
         logger.error(f"Error rendering template: {e}")
 
 
-def _export(folder: Path, output_dir: Path, as_app: bool=False) -> List[dict]:
-    """Export all marimo notebooks in a folder to HTML/WebAssembly format.
+def _python_files(folder: Path) -> List[Path]:
+    """Find the Python files in a folder, outside of public/ folders.
+
+    Hidden folders and folders starting with "__" (such as __pycache__ and __marimo__)
+    are skipped as well.
 
-    This function finds all Python files in the specified folder and exports them
-    to HTML/WebAssembly format using the export_html_wasm function. It returns a
-    list of dictionaries containing the data needed for the template.
+    Args:
+        folder (Path): Folder to search recursively
+
+    Returns:
+        List[Path]: Sorted list of paths to the Python files
+    """
+    return sorted(
+        path
+        for path in folder.rglob("*.py")
+        if not any(part == "public" or part.startswith((".", "__")) for part in path.relative_to(folder).parts[:-1])
+    )
+
+
+def _is_notebook(path: Path) -> bool:
+    """Check whether a Python file is a marimo notebook, rather than a module that notebooks import.
+
+    Args:
+        path (Path): Path to a Python file
+
+    Returns:
+        bool: True if the file defines a marimo app
+    """
+    try:
+        return "marimo.App(" in path.read_text()
+    except (OSError, UnicodeDecodeError):
+        return False
+
+
+def _find_notebooks(folder: Path) -> List[Path]:
+    """Find all marimo notebooks in a folder.
+
+    The notebooks are returned in sorted order, so that the order of the cards on the
+    index page does not depend on the file system or on the order in which exports finish.
+    Python files that do not define a marimo app are modules that the notebooks import,
+    which marimo bundles into the exports of the notebooks, so they are not exported.
 
     Args:
         folder (Path): Path to the folder containing marimo notebooks
-        output_dir (Path): Directory where the exported HTML files will be saved
-        as_app (bool, optional): Whether to export as apps (run mode) or notebooks (edit mode).
 
     Returns:
-        List[dict]: List of dictionaries with "display_name" and "html_path" for each notebook
+        List[Path]: Sorted list of paths to the notebooks in the folder
     """
     # Check if the folder exists
     if not folder.exists():
         logger.warning(f"Directory not found: {folder}")
         return []
 
-    # Find all Python files recursively in the folder
-    notebooks = list(folder.rglob("*.py"))
-    logger.debug(f"Found {len(notebooks)} Python files in {folder}")
+    # Find all Python files recursively in the folder, and keep the notebooks
+    with _timed("discovery", folder=str(folder)) as timing:
+        files = _python_files(folder)
+        notebooks = [path for path in files if _is_notebook(path)]
+        timing["files"] = len(files)
+        timing["notebooks"] = len(notebooks)
+    logger.debug(f"Found {len(notebooks)} notebooks among {len(files)} Python files in {folder}")
 
-    # Exit if no notebooks were found
+    # Warn if no notebooks were found
     if not notebooks:
         logger.warning(f"No notebooks found in {folder}!")
-        return []
+    return notebooks
 
-    # For each successfully exported notebook, add its data to the notebook_data list
-    notebook_data = [
-        {
-            "display_name": (nb.stem.replace("_", " ").title()),
-            "html_path": str(nb.with_suffix(".html")),
-        }
-        for nb in notebooks
-        if _export_html_wasm(nb, output_dir, as_app=as_app)
+
+def _export(
+    folder: Path,
+    output_dir: Path,
+    executor: Executor,
+    as_app: bool = False,
+    log_dir: Path | None = None,
+    cache_dir: Path | None = None,
+    env_dir: Path | None = None,
+    timeout: float | None = None,
+    retries: int = 0,
+) -> List[Tuple[Path, Future]]:
+    """Schedule the export of all marimo notebooks in a folder to HTML/WebAssembly format.
+
+    This function finds all Python files in the specified folder and submits their export
+    to the executor using the export_html_wasm function. It does not wait for the exports
+    to finish, so that the notebooks of several folders can share one worker pool.
+
+    Args:
+        folder (Path): Path to the folder containing marimo notebooks
+        output_dir (Path): Directory where the exported HTML files will be saved
+        executor (Executor): Worker pool that runs the exports
+        as_app (bool, optional): Whether to export as apps (run mode) or notebooks (edit mode).
+        log_dir (Path | None, optional): Directory for per-notebook log files.
+        cache_dir (Path | None, optional): Directory of the export cache, or None to always export.
+        env_dir (Path | None, optional): Directory of the shared export environments, or None to
+                                         export each notebook in its own sandbox.
+        timeout (float | None, optional): Seconds after which an export is stopped.
+        retries (int, optional): Number of retries after a transient error.
+
+    Returns:
+        List[Tuple[Path, Future]]: List of (notebook, pending export result) pairs in discovery order
+    """
+    return [
+        (
+            nb,
+            executor.submit(
+                _export_html_wasm,
+                nb,
+                output_dir,
+                as_app=as_app,
+                log_dir=log_dir,
+                cache_dir=cache_dir,
+                env_dir=env_dir,
+                timeout=timeout,
+                retries=retries,
+            ),
+        )
+        for nb in _find_notebooks(folder)
     ]
 
-    logger.info(f"Successfully exported {len(notebook_data)} out of {len(notebooks)} files from {folder}")
+
+def _notebook_data(notebook_path: Path) -> dict:
+    """Get the data of an exported notebook that is needed for the template.
+
+    Args:
+        notebook_path (Path): Path to the marimo notebook (.py file)
+
+    Returns:
+        dict: Dictionary with the "display_name" and "html_path" of the notebook
+    """
+    return {
+        "display_name": (notebook_path.stem.replace("_", " ").title()),
+        "html_path": str(notebook_path.with_suffix(".html")),
+    }
+
+
+def _collect(folder: Path, exports: List[Tuple[Path, Future]]) -> List[dict]:
+    """Wait for the exports of a folder and collect the data needed for the template.
+
+    Args:
+        folder (Path): Path to the folder containing marimo notebooks
+        exports (List[Tuple[Path, Future]]): Pending exports as returned by _export
+
+    Returns:
+        List[dict]: List of dictionaries with "display_name" and "html_path" for each notebook
+    """
+    # For each successfully exported notebook, add its data to the notebook_data list
+    notebook_data = [_notebook_data(nb) for nb, future in exports if future.result()]
+
+    if exports:
+        logger.info(f"Successfully exported {len(notebook_data)} out of {len(exports)} files from {folder}")
     return notebook_data
 
+
+def _export_dirs(build_dir: Path, no_cache: bool, shared_envs: bool) -> Tuple[Path, Path | None, Path | None]:
+    """Determine the directories for export logs, the export cache and shared environments.
+
+    Args:
+        build_dir (Path): Directory for build logs and other intermediate files
+        no_cache (bool): Whether to disable the export cache
+        shared_envs (bool): Whether to export from shared environments instead of sandboxes
+
+    Returns:
+        Tuple[Path, Path | None, Path | None]: The log directory, the cache directory (None if
+                                               disabled) and the environment directory (None if
+                                               disabled)
+    """
+    # Per-notebook export logs are kept out of the deployed output directory
+    log_dir: Path = build_dir / "logs"
+
+    # Unchanged notebooks are restored from the export cache instead of exported again
+    cache_dir: Path | None = None if no_cache else build_dir / "cache"
+    if cache_dir is not None and _marimo_version() == "unknown":
+        logger.warning("Disabling the export cache, as the marimo version is unknown")
+        cache_dir = None
+    if cache_dir is not None:
+        logger.info(f"Using export cache: {cache_dir} ({_marimo_version()})")
+
+    # Notebooks with the same dependency set share one environment instead of a sandbox each
+    env_dir: Path | None = build_dir / "envs" if shared_envs else None
+    if env_dir is not None:
+        logger.info(f"Using shared export environments: {env_dir}")
+
+    return log_dir, cache_dir, env_dir
+
+
 def main(
     output_dir: Union[str, Path] = "_site",
     template: Union[str, Path] = "templates/tailwind.html.j2",
+    build_dir: Union[str, Path] = "_build",
+    jobs: int = 1,
+    no_cache: bool = False,
+    cache_size_mb: int = 2048,
+    shared_envs: bool = False,
+    fingerprint: bool = False,
+    compress: bool = False,
+    dedup: str | None = None,
+    timeout: float = 900,
+    retries: int = 2,
+    fail_fast: bool = False,
+    tiles: str | None = None,
+    tile_zooms: str = "8-13",
+    tile_url: str | None = None,
 ) -> None:
     """Main function to export marimo notebooks.
 
@@ -189,11 +1905,49 @@ def main(
     Command line arguments:
         --output-dir: Directory where the exported files will be saved (default: _site)
         --template: Path to the template file (default: templates/index.html.j2)
+        --build-dir: Directory for build logs and other intermediate files (default: _build)
+        --jobs: Number of notebooks to export in parallel (default: 1)
+        --no-cache: Export every notebook, even if an up-to-date export is cached (default: False)
+        --cache-size-mb: Maximum size of the export cache in megabytes (default: 2048)
+        --shared-envs: Export notebooks with identical dependencies from one shared environment
+                       instead of a sandbox per notebook (default: False)
+        --fingerprint: Add content-hashed copies of public/ assets and reference them (default: False)
+        --compress: Write precompressed .gz and .br siblings of compressible files (default: False)
+        --dedup: Store identical files across exported folders once, either as hard links
+                 ("hardlink") or by also moving the marimo assets to a shared folder and
+                 rewriting the exports ("rewrite") (default: None, no deduplication)
+        --timeout: Seconds after which a single export is stopped (default: 900)
+        --retries: Number of retries of an export after a transient network error (default: 2)
+        --fail-fast: Stop the build at the first failed export (default: False)
+        --tiles: Prefetch the map tiles around the GPX tracks for this map style of the apps,
+                 e.g. "OpenStreetMap Mapnik" (default: None, no prefetching; a bare --tiles
+                 prefetches the "Stadia Outdoors" style that the apps start with)
+        --tile-zooms: Lowest and highest zoom level of the prefetched tiles (default: 8-13)
+        --tile-url: URL template of the prefetched tiles, e.g. of the tile_server command or
+                    of a tile server that allows bulk downloads; required with --tiles
 
     Returns:
         None
+
+    Raises:
+        SystemExit: With status 1 if any notebook failed to export
+        ValueError: If --tiles is given without --tile-url
     """
+    # Tile providers do not allow bulk downloads from their public servers, so refuse before exporting anything
+    if tiles and not tile_url:
+        raise ValueError(
+            "--tiles needs --tile-url: the public tile servers of the map styles do not allow bulk downloads, "
+            "prefetch from the tile_server command or a tile server that allows it"
+        )
+
     logger.info("Starting marimo build process")
+    start: float = time.perf_counter()
+
+    # Reset the state of previous builds in the same process
+    _timings.clear()
+    _environments_created.clear()
+    _environments_used.clear()
+    _abort.clear()
 
     # Convert output_dir explicitly to Path (not done by fire)
     output_dir: Path = Path(output_dir)
@@ -206,22 +1960,327 @@ def main(
     template_file: Path = Path(template)
     logger.info(f"Using template file: {template_file}")
 
-    # Export notebooks from the notebooks/ directory
-    notebooks_data = _export(Path("notebooks"), output_dir, as_app=False)
+    log_dir, cache_dir, env_dir = _export_dirs(Path(build_dir), no_cache=no_cache, shared_envs=shared_envs)
+    logger.info(f"Exporting with {jobs} parallel job(s), logs in {log_dir}")
+
+    # Notebooks and apps share one worker pool, so that a folder with few notebooks
+    # does not leave workers idle while the other folder is still exporting
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor, _timed("export", jobs=jobs):
+        # Export notebooks from the notebooks/ directory
+        notebook_exports = _export(
+            Path("notebooks"), output_dir, executor, as_app=False, log_dir=log_dir, cache_dir=cache_dir,
+            env_dir=env_dir, timeout=timeout, retries=retries,
+        )
+
+        # Export apps from the apps/ directory
+        app_exports = _export(
+            Path("apps"), output_dir, executor, as_app=True, log_dir=log_dir, cache_dir=cache_dir,
+            env_dir=env_dir, timeout=timeout, retries=retries,
+        )
+
+        # Stop all remaining exports as soon as one fails
+        if fail_fast:
+            for _, future in notebook_exports + app_exports:
+                future.add_done_callback(_abort_on_failure)
+
+        notebooks_data = _collect(Path("notebooks"), notebook_exports)
+        apps_data = _collect(Path("apps"), app_exports)
+
+    # Report how well the shared environments were reused
+    if env_dir is not None and _environments_used:
+        logger.info(
+            f"Exported {sum(_environments_used.values())} notebooks with {len(_environments_used)} shared "
+            f"environment(s), {len(_environments_created)} of which were created in this build"
+        )
+
+    # Keep the export cache within its size limit
+    if cache_dir is not None:
+        _evict_cache(cache_dir, cache_size_mb)
 
-    # Export apps from the apps/ directory
-    apps_data = _export(Path("apps"), output_dir, as_app=True)
+    # After a failure in --fail-fast mode, the site is incomplete and not worth finishing
+    if _abort.is_set():
+        _write_timings(Path(build_dir) / "timings.json", time.perf_counter() - start, jobs=jobs)
+        _report_failures()
+        raise SystemExit(1)
 
     # Exit if no notebooks or apps were found
     if not notebooks_data and not apps_data:
         logger.warning("No notebooks or apps found!")
+        if _report_failures():
+            raise SystemExit(1)
         return
 
+    # Precompute compact copies of the GPX tracks, so the apps do not have to parse XML
+    with _timed("tracks"):
+        _compact_tracks(output_dir)
+
+    # Give public/ assets content-hashed names, so they can be cached forever
+    if fingerprint:
+        with _timed("fingerprint"):
+            _fingerprint_assets(output_dir)
+
+    # Download the map tiles around the tracks, after fingerprinting as the apps build tile URLs at runtime
+    if tiles:
+        # A bare --tiles flag is passed as True by fire
+        provider: str = "Stadia Outdoors" if tiles is True else tiles
+        lowest, _, highest = str(tile_zooms).partition("-")
+        with _timed("tiles", provider=provider) as timing:
+            timing["tiles"] = _prefetch_tiles(
+                output_dir, Path(build_dir) / "tiles", tile_url, provider, (int(lowest), int(highest or lowest))
+            )
+
+    # Store identical files of the exported folders only once
+    if dedup:
+        # A bare --dedup flag is passed as True by fire
+        mode: str = "hardlink" if dedup is True else dedup
+        with _timed("dedup", mode=mode) as timing:
+            timing["bytes_saved"] = _dedup_output(output_dir, mode=mode)
+
     # Generate the index.html file that lists all notebooks and apps
     _generate_index(output_dir=output_dir, notebooks_data=notebooks_data, apps_data=apps_data, template_file=template_file)
 
+    # Precompress the output last, so that it includes the index
+    if compress:
+        with _timed("compress"):
+            _compress_output(output_dir, jobs=jobs)
+
+    # Write the timing report and summarise the slowest notebooks
+    _write_timings(Path(build_dir) / "timings.json", time.perf_counter() - start, jobs=jobs)
+
+    # The site is complete apart from the failed notebooks, but the build should still fail
+    if _report_failures():
+        logger.error(f"Build completed with failures. Output directory: {output_dir}")
+        raise SystemExit(1)
+
     logger.info(f"Build completed successfully. Output directory: {output_dir}")
 
 
+def _snapshot(paths: List[Path]) -> Dict[Path, Tuple[int, int]]:
+    """Take a snapshot of the modification times and sizes of all files under some paths.
+
+    Hidden files and folders and folders starting with "__" (such as __pycache__ and
+    __marimo__) are skipped, as they change without affecting the build.
+
+    Args:
+        paths (List[Path]): Files and folders to include in the snapshot
+
+    Returns:
+        Dict[Path, Tuple[int, int]]: Modification time (ns) and size of every file
+    """
+    files: Dict[Path, Tuple[int, int]] = {}
+    for root in paths:
+        candidates = [root] if root.is_file() else root.rglob("*") if root.is_dir() else []
+        for path in candidates:
+            if any(part.startswith((".", "__")) for part in path.parts) or not path.is_file():
+                continue
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                # Removed while taking the snapshot
+                continue
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def _rebuild(
+    changed: List[Path],
+    output_dir: Path,
+    template_file: Path,
+    folders: Dict[Path, bool],
+    log_dir: Path,
+    cache_dir: Path | None,
+    env_dir: Path | None,
+    timeout: float | None = None,
+    retries: int = 0,
+) -> None:
+    """Incrementally update the output directory after files have changed.
+
+    Changed notebooks are exported again, removed notebooks are removed from the output,
+    changed public/ assets are copied into the output, a changed module exports the
+    notebooks that can import it again, and the index is only rendered again when the
+    template or the set of exported notebooks changed.
+
+    Args:
+        changed (List[Path]): Files that were added, modified or removed
+        output_dir (Path): Directory where the exported files are saved
+        template_file (Path): Path to the template file
+        folders (Dict[Path, bool]): Watched notebook folders, mapped to whether they contain apps
+        log_dir (Path): Directory for per-notebook log files
+        cache_dir (Path | None): Directory of the export cache, or None to always export
+        env_dir (Path | None): Directory of the shared export environments, or None to use sandboxes
+        timeout (float | None, optional): Seconds after which an export is stopped, or None to
+                                          wait indefinitely. Defaults to None.
+        retries (int, optional): Number of retries after a transient error. Defaults to 0.
+
+    Returns:
+        None
+    """
+    render_index: bool = template_file in changed
+    # Notebooks to export again because a module next to them changed
+    dependents: Dict[Path, Path] = {}
+
+    for path in sorted(changed):
+        folder: Path | None = next((f for f in folders if path.is_relative_to(f)), None)
+        if folder is None:
+            continue
+
+        if "public" in path.relative_to(folder).parts:
+            # Public assets are copied along with the notebooks, no export is needed
+            target: Path = output_dir / path
+            if path.exists():
+                logger.info(f"Copying changed asset {path}")
+                target.parent.mkdir(parents=True, exist_ok=True)
+                _copy_file(path, target)
+            else:
+                logger.info(f"Removing deleted asset {path}")
+                target.unlink(missing_ok=True)
+                if target.suffix == ".gpx":
+                    target.with_suffix(".bin").unlink(missing_ok=True)
+            # Keep the compact tracks and their manifest up to date
+            if path.suffix == ".gpx" and target.parent.is_dir():
+                _compact_folder(target.parent)
+            # The public/ folder is part of the cache key of the notebooks next to it
+            _public_digest.cache_clear()
+        elif path.suffix == ".py" and not _is_notebook(path) and not (output_dir / path.with_suffix(".html")).exists():
+            # Modules are bundled into the exports of the notebooks that can import them, in the folders above
+            logger.info(f"Module {path} changed, exporting the notebooks that can import it again")
+            _modules_digest.cache_clear()
+            dependents.update(
+                (nb, folder) for nb in _find_notebooks(folder) if path.is_relative_to(nb.parent) and nb not in changed
+            )
+        elif path.suffix == ".py":
+            html_file: Path = output_dir / path.with_suffix(".html")
+            was_exported: bool = html_file.exists()
+            if path.exists():
+                exported: bool = _export_html_wasm(
+                    path,
+                    output_dir,
+                    as_app=folders[folder],
+                    log_dir=log_dir,
+                    cache_dir=cache_dir,
+                    env_dir=env_dir,
+                    timeout=timeout,
+                    retries=retries,
+                )
+                if not exported:
+                    html_file.unlink(missing_ok=True)
+            else:
+                logger.info(f"Removing deleted notebook {path}")
+                html_file.unlink(missing_ok=True)
+            render_index = render_index or html_file.exists() != was_exported
+
+    for notebook, folder in sorted(dependents.items()):
+        html_file: Path = output_dir / notebook.with_suffix(".html")
+        was_exported: bool = html_file.exists()
+        if not _export_html_wasm(
+            notebook,
+            output_dir,
+            as_app=folders[folder],
+            log_dir=log_dir,
+            cache_dir=cache_dir,
+            env_dir=env_dir,
+            timeout=timeout,
+            retries=retries,
+        ):
+            html_file.unlink(missing_ok=True)
+        render_index = render_index or html_file.exists() != was_exported
+
+    if render_index:
+        # Only notebooks that currently have an export are listed
+        exported: Dict[bool, List[dict]] = {False: [], True: []}
+        for folder, as_app in folders.items():
+            exported[as_app].extend(
+                _notebook_data(nb)
+                for nb in _python_files(folder)
+                if (output_dir / nb.with_suffix(".html")).exists()
+            )
+        _generate_index(
+            output_dir=output_dir, notebooks_data=exported[False], apps_data=exported[True], template_file=template_file
+        )
+
+
+def watch(
+    output_dir: Union[str, Path] = "_site",
+    template: Union[str, Path] = "templates/tailwind.html.j2",
+    build_dir: Union[str, Path] = "_build",
+    jobs: int = 1,
+    no_cache: bool = False,
+    shared_envs: bool = False,
+    timeout: float = 900,
+    retries: int = 2,
+    interval: float = 1.0,
+) -> None:
+    """Build the site and keep it up to date while notebooks, assets or the template change.
+
+    This function:
+    1. Runs a full build (see main)
+    2. Polls the 'notebooks' and 'apps' directories (including their public/ assets) and the
+       template for changes
+    3. Exports only the changed notebooks, copies only the changed assets and renders the
+       index again only when the template or the list of notebooks changed
+
+    Command line arguments:
+        --output-dir: Directory where the exported files will be saved (default: _site)
+        --template: Path to the template file (default: templates/tailwind.html.j2)
+        --build-dir: Directory for build logs and other intermediate files (default: _build)
+        --jobs: Number of notebooks to export in parallel during the initial build (default: 1)
+        --no-cache: Export every notebook, even if an up-to-date export is cached (default: False)
+        --shared-envs: Export notebooks with identical dependencies from one shared environment
+                       instead of a sandbox per notebook (default: False)
+        --timeout: Seconds after which a single export is stopped (default: 900)
+        --retries: Number of retries of an export after a transient network error (default: 2)
+        --interval: Seconds between two checks for changes (default: 1.0)
+
+    Returns:
+        None
+    """
+    try:
+        main(
+            output_dir=output_dir,
+            template=template,
+            build_dir=build_dir,
+            jobs=jobs,
+            no_cache=no_cache,
+            shared_envs=shared_envs,
+            timeout=timeout,
+            retries=retries,
+        )
+    except SystemExit:
+        # Failed notebooks are exported again once they change
+        logger.warning("Initial build had failures, watching for changes anyway")
+
+    output_dir: Path = Path(output_dir)
+    template_file: Path = Path(template)
+    log_dir, cache_dir, env_dir = _export_dirs(Path(build_dir), no_cache=no_cache, shared_envs=shared_envs)
+
+    # Watched notebook folders, mapped to whether they are exported as apps
+    folders: Dict[Path, bool] = {Path("notebooks"): False, Path("apps"): True}
+    watched: List[Path] = [*folders, template_file]
+
+    logger.info(f"Watching {', '.join(str(p) for p in watched)} for changes (press Ctrl+C to stop)")
+    previous = _snapshot(watched)
+    try:
+        while True:
+            time.sleep(interval)
+            current = _snapshot(watched)
+            if current == previous:
+                continue
+
+            # Wait until the files stop changing, e.g. while an editor is still saving
+            while True:
+                time.sleep(interval)
+                settled = _snapshot(watched)
+                if settled == current:
+                    break
+                current = settled
+
+            changed: List[Path] = [p for p in current.keys() | previous.keys() if current.get(p) != previous.get(p)]
+            previous = current
+            logger.info(f"Detected {len(changed)} changed file(s)")
+            _rebuild(changed, output_dir, template_file, folders, log_dir, cache_dir, env_dir, timeout=timeout, retries=retries)
+    except KeyboardInterrupt:
+        logger.info("Stopped watching")
+
+
 if __name__ == '__main__':
-    fire.Fire(main)
+    fire.Fire({"main": main, "watch": watch, "tile_server": tile_server})
@@ -0,0 +1,956 @@
+"""
+Trail processing shared by the GPX viewer apps.
+
+Reads GPX files (streamed into NumPy arrays, with gpxpy as a fallback) and the compact
+tracks written by the build, computes the geometry, statistics and levels of detail of
+a trail, caches parsed trails, and draws them with folium or Altair. The module does not
+depend on marimo, so it can be used and benchmarked on its own:
+
+    import gpx_trails
+    trail = gpx_trails.get_gpx_data("public/gpx-trails/example.gpx")
+
+The folium and Altair renderers are only available if their map libraries are installed.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import re
+import urllib.error
+import urllib.request
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from functools import cache, partial
+from hashlib import sha256
+from html import escape
+from io import BytesIO
+from json import dumps, load, loads
+from xml.etree import ElementTree
+
+import numpy as np
+from gpxpy import parse
+from gpxpy.gpx import GPXException
+
+try:
+    import folium
+    from folium.plugins import MousePosition
+except ImportError:
+    folium = None
+
+try:
+    import altair as alt
+    import altair_tiles as til
+    from xyzservices import TileProvider
+except ImportError:
+    alt = None
+
+
+# same earth radius as gpxpy.geo, so lengths match gpxpy's haversine_distance
+EARTH_RADIUS = 6378137.0
+
+
+# tolerances in metres of the precomputed levels of detail of a track
+LEVELS = {"full": 0.0, "high": 2.0, "medium": 10.0, "low": 40.0}
+
+
+def significance(track: np.ndarray, tolerance: float) -> np.ndarray:
+    """Douglas-Peucker significance in metres of every point of an (N, 2) array of latitude, longitude.
+
+    A point is kept by simplification with tolerance t if its significance is above t, so a single pass
+    gives every level of detail with a tolerance of at least `tolerance`. The first and last point are
+    always kept."""
+    n = len(track)
+    result = np.zeros(n)
+    if n == 0:
+        return result
+    result[[0, -1]] = np.inf
+    if n < 3:
+        return result
+
+    # local equirectangular projection to x, y in metres
+    xy = np.radians(track[:, ::-1]) * EARTH_RADIUS
+    xy[:, 0] *= np.cos(np.radians(track[:, 0].mean()))
+
+    stack = [(0, n - 1, np.inf)]
+    while stack:
+        first, last, bound = stack.pop()
+        if last - first < 2:
+            continue
+        # distance of the points in between to the line from first to last
+        dx, dy = xy[last] - xy[first]
+        points = xy[first + 1 : last] - xy[first]
+        norm = np.hypot(dx, dy)
+        if norm > 0:
+            distance = np.abs(dx * points[:, 1] - dy * points[:, 0]) / norm
+        else:
+            distance = np.hypot(points[:, 0], points[:, 1])
+        i = int(np.argmax(distance))
+        if distance[i] > tolerance:
+            split = first + 1 + i
+            # a point is only reached if the split above it was made too
+            result[split] = min(distance[i], bound)
+            stack += [(first, split, result[split]), (split, last, result[split])]
+    return result
+
+
+def auto_level(trail, width: int = 600) -> str:
+    """Coarsest level of detail whose tolerance is below one pixel of a map of the given width fitted to the trail."""
+    south, west, north, east = trail.bbox
+    span = max(north - south, (east - west) * np.cos(np.radians(trail.centre[0]))) * np.radians(1) * EARTH_RADIUS
+    pixel = span / width
+    return max((level for level, tolerance in LEVELS.items() if tolerance <= pixel), key=LEVELS.get)
+
+
+def distance(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Distances in metres between the points of two (N, 2) arrays of latitude, longitude."""
+    lat1, lon1, lat2, lon2 = np.radians(a[:, 0]), np.radians(a[:, 1]), np.radians(b[:, 0]), np.radians(b[:, 1])
+    h = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arctan2(np.sqrt(h), np.sqrt(1 - h))
+
+
+def haversine(track: np.ndarray) -> np.ndarray:
+    """Distances in metres between consecutive points of an (N, 2) array of latitude, longitude."""
+    return distance(track[:-1], track[1:])
+
+
+# size in degrees of the cells of the grid index, which the build uses for the manifest as well
+GRID_CELL = 0.01
+
+
+def grid_cells(track: np.ndarray, cell: float = GRID_CELL) -> np.ndarray:
+    """Cells (row, column) of a grid of `cell` degrees that a track passes through, as an (M, 2) int array.
+
+    Segments are sampled every half cell, so the cells between two distant points are included as well."""
+    if len(track) < 2:
+        return np.unique(np.floor(track / cell).astype(np.int64), axis=0)
+    segments = np.diff(track, axis=0)
+    steps = np.ceil(np.abs(segments).max(axis=1) / (cell / 2)).astype(np.int64).clip(min=1)
+    offsets = np.arange(steps.sum()) - np.repeat(np.cumsum(steps) - steps, steps)
+    points = np.repeat(track[:-1], steps, axis=0) + np.repeat(segments / steps[:, None], steps, axis=0) * offsets[:, None]
+    return np.unique(np.floor(np.vstack((points, track[-1:])) / cell).astype(np.int64), axis=0)
+
+
+class TrailIndex:
+    """Grid index of the trails: the cells of `cell` degrees that every trail passes through."""
+
+    def __init__(self, cells: list, cell: float = GRID_CELL):
+        self.cell = cell
+        # one row per occupied cell of a trail, with the trail number alongside
+        self.cells = np.vstack([np.asarray(c, dtype=np.int64).reshape(-1, 2) for c in cells] or [np.empty((0, 2))])
+        self.owners = np.repeat(np.arange(len(cells)), [len(c) for c in cells])
+
+    def viewport(self, south: float, west: float, north: float, east: float) -> list[int]:
+        """Numbers of the trails that pass through a rectangle of latitude and longitude."""
+        lat, lon = self.cells[:, 0], self.cells[:, 1]
+        inside = (
+            (lat >= np.floor(south / self.cell))
+            & (lat <= np.floor(north / self.cell))
+            & (lon >= np.floor(west / self.cell))
+            & (lon <= np.floor(east / self.cell))
+        )
+        return sorted(set(self.owners[inside].tolist()))
+
+    def near(self, lat: float, lon: float, km: float) -> list[int]:
+        """Numbers of the trails that pass within `km` of a point, to within the size of a cell."""
+        south, west = self.cells[:, 0] * self.cell, self.cells[:, 1] * self.cell
+        # nearest point of every cell to the point
+        nearest = np.column_stack((np.clip(lat, south, south + self.cell), np.clip(lon, west, west + self.cell)))
+        within = distance(np.broadcast_to([lat, lon], nearest.shape), nearest) <= km * 1_000
+        return sorted(set(self.owners[within].tolist()))
+
+
+# points in the moving average of the elevation, against GPS noise in the ascent and descent
+SMOOTHING = 5
+# slowest speed in m/s that counts as moving
+MOVING_SPEED = 0.5
+
+
+def smooth(values: np.ndarray, window: int = SMOOTHING) -> np.ndarray:
+    """Centred moving average of `window` points, repeating the first and last value at the ends."""
+    if len(values) < window:
+        return values
+    padded = np.pad(values, (window // 2, window - 1 - window // 2), mode="edge")
+    return np.convolve(padded, np.ones(window) / window, mode="valid")
+
+
+@dataclass
+class Trail:
+    name: str
+    track: np.ndarray = field(default_factory=lambda: np.empty((0, 2)))
+    times: np.ndarray | None = None
+    elevation: np.ndarray | None = None
+    centre: tuple = field(init=False)
+    length: float = field(init=False)
+    bbox: tuple = field(init=False)
+    distance: np.ndarray = field(init=False)
+    speed: np.ndarray | None = field(init=False)
+    ascent: float | None = field(init=False)
+    descent: float | None = field(init=False)
+    elapsed_time: float | None = field(init=False)
+    moving_time: float | None = field(init=False)
+    moving_speed: float | None = field(init=False)
+    levels: dict = field(init=False, repr=False)
+
+    def __post_init__(self):
+        # contiguous (N, 2) float64 array of latitude, longitude
+        self.track = np.ascontiguousarray(self.track, dtype=np.float64).reshape(-1, 2)
+        if self.elevation is not None:
+            self.elevation = np.asarray(self.elevation, dtype=np.float64)
+        segments = haversine(self.track) if len(self.track) > 1 else np.empty(0)
+        # cumulative distance in metres from the start, one value per point
+        self.distance = np.concatenate(([0.0], np.cumsum(segments))) if len(self.track) else np.empty(0)
+        self.length = float(self.distance[-1]) if len(self.track) else 0.0
+        if len(self.track):
+            self.centre = tuple(self.track.mean(axis=0).tolist())
+            # (south, west, north, east)
+            self.bbox = (*self.track.min(axis=0).tolist(), *self.track.max(axis=0).tolist())
+        else:
+            self.centre = (52.0, 5.0)  # Default fallback (Netherlands approx)
+            self.bbox = (*self.centre, *self.centre)
+
+        # total ascent and descent in metres of the smoothed elevation, skipping points without one
+        self.ascent = self.descent = None
+        if self.elevation is not None and np.isfinite(self.elevation).sum() > 1:
+            climb = np.diff(smooth(self.elevation[np.isfinite(self.elevation)]))
+            self.ascent, self.descent = float(climb[climb > 0].sum()), float(-climb[climb < 0].sum())
+
+        # speed in m/s per segment, NaN where the time does not increase
+        self.speed = self.elapsed_time = self.moving_time = self.moving_speed = None
+        if self.times is not None and len(self.times) == len(self.track) > 1:
+            self.times = np.asarray(self.times, dtype="datetime64[ms]")
+            seconds = np.diff(self.times).astype(np.float64) / 1_000
+            with np.errstate(divide="ignore", invalid="ignore"):
+                self.speed = np.where(seconds > 0, segments / seconds, np.nan)
+            # elapsed and moving time in seconds, and the average speed while moving
+            known = self.times[~np.isnat(self.times)]
+            if len(known):
+                self.elapsed_time = float((known.max() - known.min()) / np.timedelta64(1, "s"))
+            moving = self.speed >= MOVING_SPEED
+            self.moving_time = float(seconds[moving].sum())
+            self.moving_speed = float(segments[moving].sum()) / self.moving_time if self.moving_time else None
+
+        # simplified tracks for drawing, by level of detail
+        points = significance(self.track, min(t for t in LEVELS.values() if t > 0))
+        self.levels = {
+            level: self.track[points > tolerance] if tolerance > 0 else self.track
+            for level, tolerance in LEVELS.items()
+        }
+
+
+# https://github.com/pola-rs/polars/blob/405b194a9a9e40e295571451b99bc68f9bbffcaf/py-polars/src/polars/io/_utils.py#L299
+def process_file_url(path: str, encoding: str | None = None) -> BytesIO:
+    with urllib.request.urlopen(path) as f:
+        if not encoding or encoding in {"utf8", "utf8-lossy"}:
+            return BytesIO(f.read())
+        else:
+            return BytesIO(f.read().decode(encoding).encode("utf8"))
+
+
+def browser_storage():
+    """The browser's localStorage in Pyodide, or None."""
+    if not is_pyodide():
+        return None
+    try:
+        from js import localStorage
+
+        return localStorage
+    except ImportError:
+        return None
+
+
+def list_gpx_files(tree: str, storage=None):
+    """Lists the .gpx paths in the GitHub tree with a conditional request.
+
+    The paths and the ETag of the response are kept in storage (anything with getItem and setItem,
+    by default the browser's localStorage), so an unchanged tree costs a 304 without a body and
+    does not count against the API rate limit."""
+    storage = storage if storage is not None else browser_storage()
+    cached = storage.getItem(tree) if storage is not None else None
+    cached = loads(cached) if cached else None
+
+    request = urllib.request.Request(tree, headers={"If-None-Match": cached["etag"]} if cached else {})
+    try:
+        with urllib.request.urlopen(request) as f:
+            if f.status == 304 and cached:
+                return cached["paths"]
+            etag = f.headers.get("ETag")
+            paths = [item.get("path") for item in load(f).get("tree") if item.get("path").endswith(".gpx")]
+    except urllib.error.HTTPError as e:
+        if e.code == 304 and cached:
+            return cached["paths"]
+        raise
+
+    if storage is not None and etag:
+        storage.setItem(tree, dumps({"etag": etag, "paths": paths}))
+    return paths
+
+
+# https://github.com/marimo-team/marimo/blob/355103923506a3296d0e0695fb9e874c737da6ae/marimo/_utils/platform.py#L11
+def is_pyodide() -> bool:
+    import sys
+
+    return "pyodide" in sys.modules
+
+
+class PointBuffer:
+    """Preallocated arrays for the coordinates, elevation and time of points, doubled in size when full."""
+
+    def __init__(self, capacity: int = 4096):
+        self.size = 0
+        self.coords = np.empty((capacity, 2), dtype=np.float64)
+        self.ele = np.full(capacity, np.nan)
+        self.time = np.full(capacity, np.datetime64("NaT", "ms"), dtype="datetime64[ms]")
+
+    def append(self, lat: float, lon: float, ele: float, time):
+        if self.size == len(self.coords):
+            self.coords = np.concatenate((self.coords, np.empty_like(self.coords)))
+            self.ele = np.concatenate((self.ele, np.full(len(self.ele), np.nan)))
+            self.time = np.concatenate((self.time, np.full(len(self.time), np.datetime64("NaT", "ms"))))
+        self.coords[self.size] = lat, lon
+        self.ele[self.size] = ele
+        self.time[self.size] = time
+        self.size += 1
+
+    def arrays(self):
+        """Returns the coordinates, and the elevation and time if every point has them."""
+        n = self.size
+        ele = self.ele[:n] if n and not np.isnan(self.ele[:n]).any() else None
+        time = self.time[:n] if n and not np.isnat(self.time[:n]).any() else None
+        return self.coords[:n], ele, time
+
+
+def parse_time(text: str) -> np.datetime64:
+    t = datetime.fromisoformat(text.strip())
+    if t.tzinfo:
+        t = t.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(t, "ms")
+
+
+def read_points(source) -> tuple:
+    """Streams the track points (or route points) of a GPX file or file object into arrays,
+    without building gpxpy's object model.
+
+    Returns the name of the track (or route, or None), its (N, 2) array of latitude, longitude,
+    and its times and elevation if every point has them. The build reads GPX files with it too."""
+    buffers = {"trkpt": PointBuffer(), "rtept": PointBuffer()}
+    names = {}
+    path = []
+    lat = lon = ele = time = None
+
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        # local name without the GPX namespace
+        tag = elem.tag.rpartition("}")[2]
+        if event == "start":
+            path.append((tag, elem))
+            if tag in buffers:
+                lat, lon = float(elem.attrib["lat"]), float(elem.attrib["lon"])
+                ele, time = np.nan, np.datetime64("NaT", "ms")
+            continue
+
+        path.pop()
+        parent, parent_elem = path[-1] if path else (None, None)
+        if tag in buffers:
+            buffers[tag].append(lat, lon, ele, time)
+            # drop the parsed point, so the tree never holds more than one
+            parent_elem.remove(elem)
+        elif tag == "ele" and parent in buffers and elem.text:
+            ele = float(elem.text)
+        elif tag == "time" and parent in buffers and elem.text:
+            time = parse_time(elem.text)
+        elif tag == "name" and parent in ("trk", "rte") and elem.text:
+            names.setdefault(parent, elem.text.strip())
+
+    # like gpxpy: route points are only used if the file has no track points
+    kind = "trk" if buffers["trkpt"].size else "rte"
+    if not buffers[f"{kind}pt"].size:
+        raise ValueError("GPX file without track or route points")
+    # copies release the unused capacity of the buffers
+    track, elevation, times = (None if a is None else a.copy() for a in buffers[f"{kind}pt"].arrays())
+    return names.get(kind), track, times, elevation
+
+
+def read_gpx(source, name: str) -> Trail:
+    """Streams the track points (or route points) of a GPX file or file object into a Trail."""
+    track_name, track, times, elevation = read_points(source)
+    return Trail(track_name or name, track, times, elevation)
+
+
+def parse_with_gpxpy(contents, name: str) -> Trail:
+    gpx = parse(contents)
+
+    points = []
+    elevation = []
+    times = []
+    for track in gpx.tracks:
+        if track.name:
+            name = track.name
+        for segment in track.segments:
+            for point in segment.points:
+                points.append((point.latitude, point.longitude))
+                elevation.append(point.elevation)
+                times.append(point.time)
+
+    if not points:
+        for route in gpx.routes:
+            if route.name:
+                name = route.name
+            for point in route.points:
+                points.append((point.latitude, point.longitude))
+                elevation.append(point.elevation)
+                times.append(point.time)
+
+    if not points:
+        raise ValueError("GPX file without track or route points")
+    # elevation and times are only used if every point has them
+    elevation = np.array(elevation, dtype=np.float64) if elevation and None not in elevation else None
+    if times and all(times):
+        # in UTC, like parse_time, so that offsets that differ within a file do not shift the times
+        times = np.array(
+            [t.astimezone(timezone.utc).replace(tzinfo=None) if t.tzinfo else t for t in times], dtype="datetime64[ms]"
+        )
+    else:
+        times = None
+    return Trail(name, np.array(points, dtype=np.float64), times, elevation)
+
+
+def read_bytes(location) -> bytes:
+    """Reads a file next to the notebook, which has to be downloaded in Pyodide."""
+    if is_pyodide():
+        return process_file_url(str(location)).read()
+    with open(location, "rb") as f:
+        return f.read()
+
+
+# version of the compact track format that the build writes and this module reads
+COMPACT_VERSION = 2
+
+
+def load_manifest(folder) -> dict:
+    """Returns the manifest entries of the compact tracks in a folder by GPX file name,
+    or an empty dict if the archive was not built (e.g. when running locally)."""
+    try:
+        manifest = loads(read_bytes(folder / "manifest.json"))
+    except (OSError, ValueError):
+        return {}
+    if manifest.get("version") != COMPACT_VERSION:
+        return {}
+    return {entry["file"]: {**entry, "cell": manifest.get("cell")} for entry in manifest["trails"]}
+
+
+def read_compact(data: bytes, entry: dict) -> Trail:
+    """Decodes a compact track: delta-encoded int32 columns, each divided by its entry in entry["scales"].
+
+    The columns are latitude and longitude, and elevation and the seconds since entry["start"] when every
+    point of the track has them."""
+    deltas = np.frombuffer(data, dtype="<i4").reshape(len(entry["columns"]), entry["points"])
+    values = np.cumsum(deltas, axis=1, dtype=np.int64) / np.asarray(entry["scales"], dtype=np.float64)[:, None]
+    columns = dict(zip(entry["columns"], values))
+    times = None
+    if "time" in columns:
+        start = np.datetime64(round(entry["start"] * 1_000), "ms")
+        times = start + (columns["time"] * 1_000).astype("timedelta64[ms]")
+    return Trail(entry["name"], np.column_stack((columns["lat"], columns["lon"])), times, columns.get("ele"))
+
+
+def data_location(file_path: str, entry=None) -> str:
+    """Location of the file to read for a trail: its compact copy if the manifest lists it."""
+    return file_path.removesuffix(entry["file"]) + entry["data"] if entry is not None else file_path
+
+
+def get_gpx_data(file_path=None, name=None, contents=None, upload=False, entry=None):
+    """Parses contents of GPX file and returns a Trail.
+
+    With the manifest entry of the file, the compact copy written at build time is read instead.
+    Contents that were downloaded already can be passed along with the file_path."""
+    if not upload and file_path:
+        name = file_path
+        if contents is None:
+            contents = read_bytes(data_location(file_path, entry))
+        if entry is not None:
+            return read_compact(contents, entry)
+
+    try:
+        # BytesIO shares the buffer of the bytes it is given, so the contents are not copied
+        return read_gpx(BytesIO(contents), name)
+    except (ElementTree.ParseError, KeyError, ValueError):
+        # files the streaming reader does not understand are left to gpxpy
+        try:
+            return parse_with_gpxpy(contents, name)
+        except (GPXException, ValueError) as e:
+            raise ValueError(f"{name} can not be read as a GPX file: {e}") from e
+
+
+# largest GPX file in MB that can be uploaded
+MAX_UPLOAD_MB = 25
+
+
+def upload_batch(uploads, max_bytes: int = MAX_UPLOAD_MB * 1_000_000) -> tuple[list[dict], list[str]]:
+    """Sources to load for a batch of uploaded files, and the reasons that other files were skipped.
+
+    Files that are too large, and files with the same contents as an earlier file of the batch, are skipped.
+    The hash of the contents goes along, so that it is not computed again for the cache."""
+    sources, skipped, seen = [], [], {}
+    for file in uploads:
+        if len(file.contents) > max_bytes:
+            skipped.append(f"{file.name} is larger than {max_bytes / 1_000_000:.0f} MB")
+            continue
+        digest = sha256(file.contents).hexdigest()
+        if digest in seen:
+            skipped.append(f"{file.name} is the same file as {seen[digest]}")
+            continue
+        seen[digest] = file.name
+        sources.append({"name": file.name, "contents": file.contents, "upload": True, "digest": digest})
+    return sources, skipped
+
+
+class TrailCache:
+    """Least recently used trails, keyed by location (or upload name) and content hash, bounded by the
+    memory of their arrays."""
+
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.entries = OrderedDict()
+
+    @staticmethod
+    def nbytes(trail: Trail) -> int:
+        arrays = [trail.track, trail.distance, trail.times, trail.elevation, trail.speed, *trail.levels.values()]
+        return sum(a.nbytes for a in arrays if a is not None)
+
+    def get(self, key):
+        trail = self.entries.get(key)
+        if trail is not None:
+            self.entries.move_to_end(key)
+        return trail
+
+    def put(self, key, trail: Trail):
+        if key in self.entries:
+            self.size -= self.nbytes(self.entries.pop(key))
+        self.entries[key] = trail
+        self.size += self.nbytes(trail)
+        while self.size > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= self.nbytes(evicted)
+
+
+# lives as long as the module, so re-running the display cells of a notebook does not parse the archive again
+trail_cache = TrailCache()
+
+
+async def fetch_bytes(location) -> bytes:
+    """Downloads a file with pyfetch in Pyodide, or reads it in a worker thread on CPython."""
+    if is_pyodide():
+        from pyodide.http import pyfetch
+
+        response = await pyfetch(str(location))
+        if not response.ok:
+            raise OSError(f"Downloading {location} failed with status {response.status}")
+        return await response.bytes()
+    return await asyncio.to_thread(read_bytes, location)
+
+
+# smallest file in bytes that is parsed in a worker process; starting the processes takes about a second, and
+# sending the contents and the trail between processes is only negligible next to parsing a large file
+PROCESS_MIN_BYTES = 1_000_000
+
+_processes: ProcessPoolExecutor | None = None
+
+
+def process_pool() -> ProcessPoolExecutor:
+    """Worker processes that parse large files on CPython, started on first use.
+
+    Parsing the XML and simplifying the tracks holds the GIL, so worker threads would parse one file at a time.
+    The processes are spawned rather than forked, because the notebook kernel runs threads of its own."""
+    global _processes
+    if _processes is None:
+        _processes = ProcessPoolExecutor(max_workers=min(os.cpu_count() or 1, 4), mp_context=multiprocessing.get_context("spawn"))
+    return _processes
+
+
+async def parse_trail(**source) -> Trail:
+    """Parses a trail from downloaded contents without blocking the event loop.
+
+    Large files are parsed in worker processes on CPython with more than one core, other files in a worker thread.
+    Pyodide has neither, so it parses in between downloads."""
+    parse = partial(get_gpx_data, **source)
+    if is_pyodide():
+        return parse()
+    if (os.cpu_count() or 1) > 1 and len(source.get("contents") or b"") >= PROCESS_MIN_BYTES:
+        try:
+            return await asyncio.get_running_loop().run_in_executor(process_pool(), parse)
+        except BrokenProcessPool:
+            # e.g. where processes can not be started, parse in a worker thread instead
+            pass
+    return await asyncio.to_thread(parse)
+
+
+async def load_trail(file_path=None, name=None, contents=None, upload=False, entry=None, digest=None) -> Trail:
+    """Downloads (unless uploaded) and parses a trail without blocking other downloads, or takes it from the cache.
+
+    Raises ValueError if the file can not be read as a GPX file."""
+    # the manifest has the hash of archived files, so cached trails are not even downloaded
+    digest = digest or (entry.get("sha256") if entry is not None else None)
+    key = (file_path if not upload else name, digest) if digest else None
+    if key is not None and (trail := trail_cache.get(key)) is not None:
+        return trail
+
+    if not upload and contents is None:
+        contents = await fetch_bytes(data_location(file_path, entry))
+    key = key or (file_path if not upload else name, sha256(contents).hexdigest())
+    if (trail := trail_cache.get(key)) is not None:
+        return trail
+
+    trail = await parse_trail(file_path=file_path, name=name, contents=contents, upload=upload, entry=entry)
+    trail_cache.put(key, trail)
+    return trail
+
+
+async def load_batch(sources: list[dict], numbers=None, limit: int = 8, loaded=None) -> tuple[dict, list[str]]:
+    """Loads the trails of (some of the) sources concurrently, at most `limit` at once.
+
+    Returns the trails by number of their source, and why the uploads that could not be read were skipped: an
+    unreadable upload does not stop the rest of the batch. `loaded` is called with the number of every source
+    and its trail (or the ValueError of an unreadable upload) once it is done, e.g. to show the trail right away."""
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(number):
+        async with semaphore:
+            try:
+                return number, await load_trail(**sources[number])
+            except ValueError as e:
+                if not sources[number].get("upload"):
+                    raise
+                return number, e
+
+    trails, skipped = {}, []
+    numbers = range(len(sources)) if numbers is None else numbers
+    for done in asyncio.as_completed([run(number) for number in numbers]):
+        number, trail = await done
+        if isinstance(trail, ValueError):
+            skipped.append(str(trail))
+        else:
+            trails[number] = trail
+        if loaded is not None:
+            loaded(number, trail)
+    return trails, skipped
+
+
+@cache
+def local_tiles(tiles: str, folder) -> dict | None:
+    """The tiles of a map style that the build prefetched into the public/tiles/ folder next to a notebook, or None.
+
+    Returns the tiles.json written by the build, with the URL template of the tiles relative to the page."""
+    slug = re.sub(r"[^a-z0-9]+", "-", tiles.lower()).strip("-")
+    try:
+        info = loads(read_bytes(folder / "public" / "tiles" / slug / "tiles.json"))
+    except (OSError, ValueError):
+        return None
+    return {**info, "url": f"public/tiles/{slug}/{{z}}/{{x}}/{{y}}.png"}
+
+
+# map style that the apps start with, unless the build only prefetched the tiles of other styles
+DEFAULT_TILES = "Stadia Outdoors"
+
+
+def default_tiles(folder) -> str:
+    """The map style to start a notebook with: DEFAULT_TILES, or else the first style whose tiles the build
+    prefetched into the public/tiles/ folder next to it, so that the first maps need no tile provider."""
+    try:
+        styles = loads(read_bytes(folder / "public" / "tiles" / "styles.json"))
+    except (OSError, ValueError):
+        return DEFAULT_TILES
+    return styles[0] if styles and DEFAULT_TILES not in styles else DEFAULT_TILES
+
+
+def fit_zoom(bbox, width: int, height: int) -> int:
+    """Highest zoom level at which a bounding box fits in a map of width by height pixels of 256 pixel tiles."""
+    south, west, north, east = bbox
+
+    def y(lat):
+        # position on the Web Mercator map of the world, from 0 at the top to 1 at the bottom
+        return (1 - np.arcsinh(np.tan(np.radians(lat))) / np.pi) / 2
+
+    spans = [max(east - west, 1e-6) / 360 * 256 / width, max(y(south) - y(north), 1e-9) * 256 / height]
+    return int(np.floor(np.log2(1 / max(spans))))
+
+
+def profile(trail: Trail, width: int = 600) -> tuple:
+    """Elevation against distance, downsampled to at most `width` columns.
+
+    Returns the distance in km of every column with the lowest and highest elevation in it, so that no
+    peak or valley is lost at screen resolution. Points without an elevation are skipped."""
+    if trail.elevation is None or not np.isfinite(trail.elevation).any():
+        return np.empty(0), np.empty(0), np.empty(0)
+    known = np.isfinite(trail.elevation)
+    elevation, distance = trail.elevation[known], trail.distance[known]
+    columns = np.minimum((distance / max(trail.length, 1.0) * width).astype(np.int64), width - 1)
+    # distance only increases, so every column is a run of consecutive points
+    starts = np.flatnonzero(np.diff(columns, prepend=-1))
+    return distance[starts] / 1_000, np.minimum.reduceat(elevation, starts), np.maximum.reduceat(elevation, starts)
+
+
+def summarise(trail=None, entry=None) -> dict:
+    """Name, length and bounding box of a trail, taken from its manifest entry if there is one."""
+    if entry is not None:
+        return {"name": entry["name"], "length": entry["length"], "points": entry["points"], "bbox": entry["bbox"]}
+    return {"name": trail.name, "length": trail.length, "points": len(trail.track), "bbox": list(trail.bbox)}
+
+
+# colours of the trails on the overview maps, by trail number
+COLOURS = ["#e41a1c", "#377eb8", "#4daf4a", "#984ea3", "#ff7f00", "#a65628", "#f781bf", "#999999"]
+
+
+class Renderer(ABC):
+    """Draws trails with a map library, on the tiles of a map style.
+
+    The tiles are served from the public/tiles/ folder next to the notebook if the build prefetched them."""
+
+    def __init__(self, tiles: str, folder=None):
+        self.tiles = tiles
+        self.local = local_tiles(tiles, folder) if folder is not None else None
+
+    @abstractmethod
+    def track(self, trail: Trail, quality: str = "auto"):
+        """A map of a trail at a level of detail, or the coarsest one that looks the same ("auto")."""
+
+    @abstractmethod
+    def overview(self, summaries: list[dict], trails: dict | None = None, shown: list[int] | None = None, quality: str = "auto"):
+        """One map with all (or the shown) trails, by their summaries and the trails that are loaded already."""
+
+    @abstractmethod
+    def profile(self, trail: Trail, width: int = 600, height: int = 120):
+        """The elevation profile of a trail, or None if the trail has no elevation."""
+
+
+class Svg(str):
+    """SVG markup that notebooks display as HTML."""
+
+    def _repr_html_(self) -> str:
+        return str(self)
+
+
+class FoliumRenderer(Renderer):
+    """Leaflet maps with folium, with an inline SVG elevation profile."""
+
+    def __init__(self, tiles: str, folder=None):
+        if folium is None:
+            raise ImportError("FoliumRenderer requires folium")
+        super().__init__(tiles, folder)
+
+    def base_map(self, location, zoom_start: int) -> "folium.Map":
+        """A map with the tiles of the map style."""
+        if self.local is None:
+            return folium.Map(location=location, zoom_start=zoom_start, tiles=self.tiles)
+        m = folium.Map(location=location, zoom_start=zoom_start, tiles=None, min_zoom=self.local["min_zoom"])
+        # beyond the highest prefetched zoom level the tiles are scaled up instead of downloaded
+        folium.TileLayer(
+            tiles=self.local["url"],
+            attr=self.local["attribution"],
+            name=self.tiles,
+            min_zoom=self.local["min_zoom"],
+            max_native_zoom=self.local["max_zoom"],
+            max_zoom=18,
+        ).add_to(m)
+        return m
+
+    def track(self, trail: Trail, quality: str = "auto"):
+        track = trail.levels[auto_level(trail) if quality == "auto" else quality]
+        m = self.base_map(trail.centre, 13)
+
+        folium.PolyLine(
+            locations=track.tolist(),
+            color="red",
+            weight=4,
+            opacity=0.8,
+            tooltip=trail.name,
+        ).add_to(m)
+        folium.Marker(
+            location=trail.track[0].tolist(),
+            popup="Start",
+            icon=folium.Icon(color="green", icon="play"),
+        ).add_to(m)
+        folium.Marker(
+            location=trail.track[-1].tolist(),
+            popup="End",
+            icon=folium.Icon(color="red", icon="stop"),
+        ).add_to(m)
+        m.fit_bounds(m.get_bounds())
+        MousePosition().add_to(m)
+
+        return m
+
+    def overview(self, summaries: list[dict], trails: dict | None = None, shown: list[int] | None = None, quality: str = "auto"):
+        """One map with all (or the shown) trails: the trails that are loaded already at the coarsest (or the given)
+        level of detail, and the bounding box of the others.
+
+        Every trail is a layer of its own, which can be switched off in the layer control, on a single tile layer."""
+        m = self.base_map((52.0, 5.0), 8)
+        level = "low" if quality == "auto" else quality
+        shown = range(len(summaries)) if shown is None else shown
+        for index in shown:
+            summary = summaries[index]
+            south, west, north, east = summary["bbox"]
+            colour = COLOURS[index % len(COLOURS)]
+            layer = folium.FeatureGroup(name=summary["name"])
+            trail = (trails or {}).get(index)
+            if trail is not None:
+                folium.PolyLine(trail.levels[level].tolist(), color=colour, weight=3, tooltip=summary["name"]).add_to(layer)
+            else:
+                folium.Rectangle(
+                    bounds=[[south, west], [north, east]],
+                    color=colour,
+                    weight=2,
+                    fill=True,
+                    fill_opacity=0.1,
+                    tooltip=summary["name"],
+                ).add_to(layer)
+            layer.add_to(m)
+        if shown:
+            boxes = np.array([summaries[index]["bbox"] for index in shown])
+            m.fit_bounds([boxes[:, :2].min(axis=0).tolist(), boxes[:, 2:].max(axis=0).tolist()])
+        folium.LayerControl(collapsed=True).add_to(m)
+        MousePosition().add_to(m)
+        return m
+
+    def profile(self, trail: Trail, width: int = 600, height: int = 120) -> Svg | None:
+        """Elevation profile of a trail as an inline SVG, or None if the trail has no elevation."""
+        km, low, high = profile(trail, width)
+        if len(km) < 2:
+            return None
+        bottom, top = float(low.min()), float(high.max())
+        x = km / km[-1] * (width - 1)
+
+        def y(values):
+            # leave room for the label of the highest elevation at the top
+            return (height - 1) - (values - bottom) / max(top - bottom, 1.0) * (height - 16)
+
+        def points(xs, ys):
+            return " ".join(f"{a:.1f},{b:.1f}" for a, b in zip(xs, ys))
+
+        # band between the lowest and highest point of every column, over a lighter area down to the axis
+        return Svg(
+            f'<svg width="{width}" height="{height}" viewBox="0 0 {width} {height}" role="img">'
+            f"<title>Elevation of {escape(trail.name)}</title>"
+            f'<polygon points="0,{height} {points(x, y(low))} {x[-1]:.1f},{height}" fill="steelblue" opacity="0.3"/>'
+            f'<polygon points="{points(x, y(high))} {points(x[::-1], y(low[::-1]))}" fill="steelblue" stroke="steelblue"/>'
+            f'<text x="2" y="10" font-size="10" fill="currentColor">{top:.0f} m</text>'
+            f'<text x="2" y="{height - 3}" font-size="10" fill="currentColor">{bottom:.0f} m</text>'
+            "</svg>"
+        )
+
+
+def columnar(decimals: dict, **columns: np.ndarray) -> "alt.Data":
+    """A dataset of a single row with an array per column, for `transform_flatten` to turn into rows.
+
+    One JSON array per column instead of one object per point keeps the spec small and quick to serialise.
+    The values of every column are rounded to its number of decimals."""
+    return alt.Data(values=[{name: np.round(values, decimals[name]).tolist() for name, values in columns.items()}])
+
+
+class AltairRenderer(Renderer):
+    """Vega-Lite charts with Altair, on map tiles from altair_tiles."""
+
+    def __init__(self, tiles: str, folder=None, width: int = 600, height: int = 400):
+        if alt is None:
+            raise ImportError("AltairRenderer requires altair, altair_tiles and xyzservices")
+        super().__init__(tiles, folder)
+        self.width, self.height = width, height
+
+    def add_tiles(self, chart, bbox):
+        """Adds the tiles of the map style to a chart of the map size."""
+        if self.local is None:
+            return til.add_tiles(chart, provider=self.tiles).properties(width=self.width, height=self.height)
+        local = self.local
+        provider = TileProvider(name=self.tiles, url=local["url"], attribution=local["attribution"], max_zoom=local["max_zoom"])
+        # the zoom level is fixed within the prefetched levels, where the tiles are scaled to fit the map
+        zoom = min(max(fit_zoom(bbox, self.width, self.height), local["min_zoom"]), local["max_zoom"])
+        return til.add_tiles(chart, provider=provider, zoom=zoom).properties(width=self.width, height=self.height)
+
+    def track(self, trail: Trail, quality: str = "auto"):
+        # the level of detail is chosen first, so only the points that can be told apart on the map are sent
+        track = trail.levels[auto_level(trail, self.width) if quality == "auto" else quality]
+        # microdegrees, about 0.1 m
+        data = columnar({"latitude": 6, "longitude": 6}, latitude=track[:, 0], longitude=track[:, 1])
+        track_chart = (
+            alt.Chart(data)
+            .transform_flatten(["latitude", "longitude"])
+            .mark_line(color="red", strokeWidth=3)
+            .encode(
+                longitude="longitude:Q",
+                latitude="latitude:Q",
+                tooltip=[
+                    alt.Tooltip("latitude:Q", title="Lat"),
+                    alt.Tooltip("longitude:Q", title="Lon"),
+                ],
+            )
+            .project(type="mercator")
+        )
+        return self.add_tiles(track_chart, trail.bbox)
+
+    def overview(self, summaries: list[dict], trails: dict | None = None, shown: list[int] | None = None, quality: str = "auto"):
+        """The loaded trails among all (or the shown) trails at the coarsest (or the given) level of detail on a
+        single map with one set of tiles, coloured by trail.
+
+        Clicking a trail in the legend highlights it."""
+        level = "low" if quality == "auto" else quality
+        shown = range(len(summaries)) if shown is None else shown
+        loaded = [index for index in shown if (trails or {}).get(index) is not None]
+        # one row per trail, with its coordinates as columns
+        data = alt.Data(
+            values=[
+                {
+                    "trail": summaries[index]["name"],
+                    "latitude": np.round(trails[index].levels[level][:, 0], 6).tolist(),
+                    "longitude": np.round(trails[index].levels[level][:, 1], 6).tolist(),
+                }
+                for index in loaded
+            ]
+        )
+        highlight = alt.selection_point(fields=["trail"], bind="legend")
+        tracks = (
+            alt.Chart(data)
+            .transform_flatten(["latitude", "longitude"])
+            .mark_line(strokeWidth=3)
+            .encode(
+                longitude="longitude:Q",
+                latitude="latitude:Q",
+                color=alt.Color(
+                    "trail:N",
+                    scale=alt.Scale(
+                        domain=[summaries[index]["name"] for index in loaded],
+                        range=[COLOURS[index % len(COLOURS)] for index in loaded],
+                    ),
+                    legend=alt.Legend(orient="bottom", columns=2),
+                ),
+                detail="trail:N",
+                opacity=alt.condition(highlight, alt.value(0.9), alt.value(0.15)),
+                tooltip=["trail:N"],
+            )
+            .add_params(highlight)
+            .project(type="mercator")
+        )
+        boxes = np.array([summaries[index]["bbox"] for index in shown] or [(52.0, 5.0, 52.0, 5.0)])
+        return self.add_tiles(tracks, (*boxes[:, :2].min(axis=0), *boxes[:, 2:].max(axis=0)))
+
+    def profile(self, trail: Trail, width: int = 600, height: int = 120):
+        """Elevation profile of a trail as an area chart, or None if the trail has no elevation."""
+        km, low, high = profile(trail, width)
+        if len(km) < 2:
+            return None
+        data = columnar({"km": 3, "low": 1, "high": 1}, km=km, low=low, high=high)
+        return (
+            alt.Chart(data)
+            .transform_flatten(["km", "low", "high"])
+            .mark_area(color="steelblue", line=True)
+            .encode(
+                x=alt.X("km:Q", title="Distance (km)"),
+                y=alt.Y("high:Q", title="Elevation (m)", scale=alt.Scale(zero=False)),
+                y2="low:Q",
+                tooltip=[alt.Tooltip("km:Q", format=".1f"), alt.Tooltip("high:Q", title="m", format=".0f")],
+            )
+            .properties(width=width, height=height)
+        )
@@ -4,6 +4,7 @@
 #     "folium>=0.20.0",
 #     "gpxpy>=1.6.2",
 #     "marimo>=0.18.3",
+#     "numpy>=2.0.0",
 # ]
 # [tool.marimo.display]
 # theme = "dark"
@@ -23,17 +24,27 @@ def _():
 
 @app.cell(hide_code=True)
 def _(mo):
-    from dataclasses import dataclass, field
-    from io import BytesIO
-    from itertools import pairwise
-    from json import load
-    import urllib.request
-    import urllib.parse
-
-    from gpxpy import parse
-    from gpxpy.geo import haversine_distance
+    # the parsers and the map library are imported here as well, so that they are installed in the browser
     import folium
-    from folium.plugins import MousePosition
+    import gpxpy
+    import numpy as np
+
+    from gpx_trails import (
+        GRID_CELL,
+        LEVELS,
+        MAX_UPLOAD_MB,
+        FoliumRenderer,
+        TrailIndex,
+        default_tiles,
+        grid_cells,
+        is_pyodide,
+        list_gpx_files,
+        load_batch,
+        load_manifest,
+        load_trail,
+        summarise,
+        upload_batch,
+    )
 
     # provide GitHub repo details
     ORG, REPO, BRANCH = "dkapitan", "marimo-playground", "main"
@@ -41,134 +52,76 @@ def _(mo):
 
     HERE = mo.notebook_location()
 
+    # map style that is selected when the app starts, one with prefetched tiles if the build downloaded them
+    DEFAULT_TILES = default_tiles(HERE)
+
 
-    @dataclass
-    class Trail:
-        name: str
-        track: list[tuple] = field(default_factory=list)
-        centre: float = field(init=False)
-        length: float = field(init=False)
-
-        def __post_init__(self):
-            if self.track:
-                avg_lat = sum(p[0] for p in self.track) / len(self.track)
-                avg_lon = sum(p[1] for p in self.track) / len(self.track)
-                self.centre = (avg_lat, avg_lon)
-                self.length = sum([haversine_distance(p[0][0], p[0][1], p[1][0], p[1][1]) for p in pairwise(self.track)])
-            else:
-                self.centre = (52.0, 5.0)  # Default fallback (Netherlands approx)
-
-
-    def clean_url(url):
-        """
-        Splits a URL, safely encodes the path and query components
-        to handle spaces and control characters, and reconstructs it.
-        Created by Gemini.
-        """
-        # 1. Split the URL into components (scheme, netloc, path, query, fragment)
-        #    urlsplit is preferred over urlparse as it treats the path more generically
-        parts = urllib.parse.urlsplit(url)
-
-        # 2. Encode the path (e.g., replace spaces with %20)
-        #    We assume the path does not contain characters that structure the URL
-        #    (like '?' or '#'), as those were stripped by urlsplit.
-        safe_path = urllib.parse.quote(parts.path)
-
-        # 3. Encode the query string
-        #    safe="=&" ensures we don't encode the delimiters that separate parameters
-        safe_query = urllib.parse.quote(parts.query, safe="=&")
-
-        # 4. Encode the fragment (anchor)
-        safe_fragment = urllib.parse.quote(parts.fragment)
-
-        # 5. Reassemble the components
-        cleaned_url = urllib.parse.urlunsplit((parts.scheme, parts.netloc, safe_path, safe_query, safe_fragment))
-
-        return cleaned_url
-
-
-    # https://github.com/pola-rs/polars/blob/405b194a9a9e40e295571451b99bc68f9bbffcaf/py-polars/src/polars/io/_utils.py#L299
-    def process_file_url(path: str, encoding: str | None = None) -> BytesIO:
-        with urllib.request.urlopen(path) as f:
-            if not encoding or encoding in {"utf8", "utf8-lossy"}:
-                return BytesIO(f.read())
-            else:
-                return BytesIO(f.read().decode(encoding).encode("utf8"))
-
-
-    def list_gpx_files(tree=tree):
-        return [item.get("path") for item in load(process_file_url(tree)).get("tree") if item.get("path").endswith(".gpx")]
-
-
-    # https://github.com/marimo-team/marimo/blob/355103923506a3296d0e0695fb9e874c737da6ae/marimo/_utils/platform.py#L11
-    def is_pyodide() -> bool:
-        import sys
-
-        return "pyodide" in sys.modules
-
-
-    def get_gpx_data(file_path=None, name=None, contents=None, upload=False):
-        """Parses contents of GPX file and returns name, center_lat, center_lon, and points."""
-        if not upload and file_path:
-            name = file_path
-            if is_pyodide():
-                gpx = parse(process_file_url(file_path).read())
-            else:
-                with open(file_path, "r") as gpx_file:
-                    gpx = parse(gpx_file.read())
-        if upload:
-            name = name
-            gpx = parse(contents)
-
-        points = []
-        for track in gpx.tracks:
-            if track.name:
-                name = track.name
-            for segment in track.segments:
-                for point in segment.points:
-                    points.append((point.latitude, point.longitude))
-
-        if not track:
-            for route in gpx.routes:
-                if route.name:
-                    name = route.name
-                for point in route.points:
-                    points.append((point.latitude, point.longitude))
-
-        return Trail(name, points)
-
-
-    def map_track(trail: Trail, tiles: str):
-        m = folium.Map(location=trail.centre, zoom_start=13, tiles=tiles)
-
-        folium.PolyLine(
-            locations=trail.track,
-            color="red",
-            weight=4,
-            opacity=0.8,
-            tooltip=trail.name,
-        ).add_to(m)
-        folium.Marker(
-            location=trail.track[0],
-            popup="Start",
-            icon=folium.Icon(color="green", icon="play"),
-        ).add_to(m)
-        folium.Marker(
-            location=trail.track[-1],
-            popup="End",
-            icon=folium.Icon(color="red", icon="stop"),
-        ).add_to(m)
-        m.fit_bounds(m.get_bounds())
-        MousePosition().add_to(m)
-
-        return m
-    return HERE, get_gpx_data, is_pyodide, list_gpx_files, map_track, tree
+    def duration(seconds):
+        hours, minutes = divmod(round(seconds / 60), 60)
+        return f"{hours}:{minutes:02d} h"
+
+
+    def card(trail, renderer, quality="auto"):
+        """Name, statistics, map and elevation profile of a trail."""
+        stats = [mo.stat(label="trail length", value=str(round(trail.length / 1_000, 1)) + " km")]
+        if trail.ascent is not None:
+            stats.append(mo.stat(label="ascent / descent", value=f"{trail.ascent:.0f} / {trail.descent:.0f} m"))
+        if trail.moving_time:
+            stats.append(
+                mo.stat(
+                    label="moving time",
+                    value=duration(trail.moving_time),
+                    caption=f"of {duration(trail.elapsed_time)}",
+                )
+            )
+            stats.append(mo.stat(label="moving speed", value=f"{trail.moving_speed * 3.6:.1f} km/h"))
+        meta = mo.vstack([mo.md(trail.name), *stats])
+        map_ = renderer.track(trail, quality=quality)
+        profile = renderer.profile(trail)
+        return mo.hstack([meta, mo.vstack([map_, profile]) if profile else map_], widths=[1, 6])
+    return (
+        DEFAULT_TILES,
+        FoliumRenderer,
+        GRID_CELL,
+        HERE,
+        LEVELS,
+        MAX_UPLOAD_MB,
+        TrailIndex,
+        card,
+        grid_cells,
+        is_pyodide,
+        list_gpx_files,
+        load_batch,
+        load_manifest,
+        load_trail,
+        summarise,
+        tree,
+        upload_batch,
+    )
 
 
 @app.cell(hide_code=True)
-def _(mo):
+def _(DEFAULT_TILES, LEVELS, MAX_UPLOAD_MB, mo):
     upload = mo.ui.switch()
-    files = mo.ui.file(filetypes=[".gpx"], kind="area", multiple=True)
+    files = mo.ui.file(filetypes=[".gpx"], kind="area", multiple=True, max_size=MAX_UPLOAD_MB * 1_000_000)
+    quality = mo.ui.dropdown(
+        options=["auto", *LEVELS],
+        value="auto",
+        label="Track detail",
+    )
+    view = mo.ui.dropdown(
+        options=["gallery", "one map", "all maps"],
+        value="gallery",
+        label="View",
+    )
+    show = mo.ui.dropdown(
+        options=["all trails", "near a place", "in an area"],
+        value="all trails",
+        label="Show",
+    )
+    place = mo.ui.text(value="52.30, 5.80", label="latitude, longitude")
+    radius = mo.ui.number(start=1, stop=1_000, step=1, value=10, label="within (km)")
+    area = mo.ui.text(value="52.20, 5.60, 52.40, 6.00", label="south, west, north, east")
     tiles = mo.ui.dropdown(
         options=[
             "Cartodb Positron",
@@ -177,7 +130,7 @@ def _(mo):
             "Stadia Outdoors",
             "Stadia StamenTerrain",
         ],
-        value="Stadia Outdoors",
+        value=DEFAULT_TILES,
         label="Choose a map style",
     )
     header = mo.md("""
@@ -186,7 +139,7 @@ def _(mo):
         Always wanted to have your little archive of your favourite trail running or gravelbike rides? You can clone [this repo](https://github.com/dkapitan/marimo-playground) to create your on online archive on GitHub.
 
         If you want to test it, toggle the switch and upload your own files to play around. It should work with `.gpx` files downloaded from Strava, Garmin or Komoot.""")
-    return files, header, tiles, upload
+    return area, files, header, place, quality, radius, show, tiles, upload, view
 
 
 @app.cell(hide_code=True)
@@ -209,53 +162,180 @@ def _(files, header, mo, upload):
 
 
 @app.cell(hide_code=True)
-def _(
+async def _(
+    DEFAULT_TILES,
+    FoliumRenderer,
+    GRID_CELL,
     HERE,
+    TrailIndex,
+    card,
     files,
-    get_gpx_data,
+    grid_cells,
     is_pyodide,
     list_gpx_files,
-    map_track,
+    load_batch,
+    load_manifest,
+    load_trail,
     mo,
-    tiles,
+    summarise,
     tree,
     upload,
+    upload_batch,
 ):
-    trails = []
-
     if not upload.value:
-        if is_pyodide():
+        # compact tracks written by the build, if any, which also list and summarise the archive
+        compact = load_manifest(HERE / "public" / "gpx-trails")
+        if compact:
+            gpx_files = [HERE / "public" / "gpx-trails" / name for name in compact]
+        elif is_pyodide():
             gpx_files = [(HERE / path[5:]) for path in list_gpx_files(tree)]
         else:
             gpx_files = HERE.glob("public/gpx-trails/*.gpx")
-        for file in gpx_files:
-            trail = get_gpx_data(file_path=str(file), upload=upload.value)
-            meta = mo.vstack(
-                [
-                    mo.md(trail.name),
-                    mo.stat(
-                        label="trail length",
-                        value=str(round(trail.length / 1_000, 1)) + " km",
-                    ),
-                ]
-            )
-            trails.append(mo.hstack([meta, map_track(trail, tiles=tiles.value)], widths=[1, 6]))
-
-    if upload.value:
-        for file in files.value:
-            trail = get_gpx_data(name=file.name, contents=file.contents, upload=upload.value)
-            meta = mo.vstack(
-                [
-                    mo.md(trail.name),
-                    mo.stat(
-                        label="trail length",
-                        value=str(round(trail.length / 1_000, 1)) + " km",
-                    ),
-                ]
-            )
-            trails.append(mo.hstack([meta, map_track(trail, tiles=tiles.value)], widths=[1, 6]))
+        sources = [{"file_path": str(file), "entry": compact.get(file.name)} for file in gpx_files]
+        skipped = []
+    else:
+        # too large and duplicate uploads are skipped before anything is parsed
+        sources, skipped = upload_batch(files.value)
+
+
+    def indexed(source):
+        """Whether the manifest has the summary and grid cells of a trail."""
+        return source.get("entry") is not None and source["entry"].get("cell") == GRID_CELL
+
+
+    # only trails without a summary in the manifest are loaded up front, the others when they are shown
+    trails = {}
+    pending = [index for index, source in enumerate(sources) if not indexed(source)]
+    if pending:
+        # trails are shown as soon as they are loaded, in the order of the archive, until the gallery takes over;
+        # the cards use the default map style, so that this cell does not run again when the style changes
+        _preview, _renderer = {}, FoliumRenderer(DEFAULT_TILES, HERE)
+
+
+        def _show(number, trail):
+            _preview[number] = None if isinstance(trail, ValueError) else card(trail, _renderer)
+            cards = [_preview[n] for n in sorted(_preview) if _preview[n] is not None]
+            mo.output.replace(mo.vstack([mo.md(f"Loading trails: {len(_preview)} of {len(pending)}")] + cards, gap=2))
+
+
+        # at most 8 trails are downloaded and parsed at once, and unreadable uploads are skipped
+        trails, unreadable = await load_batch(sources, pending, loaded=_show)
+        skipped += unreadable
+
+    if len(trails) < len(pending):
+        # number the trails that were loaded again, leaving out the unreadable uploads
+        loaded = sorted(trails)
+        sources = [sources[index] for index in loaded]
+        trails = {number: trails[index] for number, index in enumerate(loaded)}
+
+    summaries = [summarise(trails.get(index), source.get("entry")) for index, source in enumerate(sources)]
+    # grid index of where the trails go, from the manifest or the loaded trails
+    trail_index = TrailIndex(
+        [source["entry"]["cells"] if indexed(source) else grid_cells(trails[i].track) for i, source in enumerate(sources)]
+    )
+
+
+    async def get_trail(index):
+        """Returns a loaded trail, loading it (or taking it from the cache) if needed."""
+        if index not in trails:
+            trails[index] = await load_trail(**sources[index])
+        return trails[index]
+
+
+    mo.callout(mo.md("Skipped:\n\n" + "\n".join(f"- {reason}" for reason in skipped)), kind="warn") if skipped else None
+    return get_trail, summaries, trail_index, trails
+
+
+@app.cell(hide_code=True)
+def _(area, mo, place, radius, show, summaries, trail_index):
+    def numbers(text: str, count: int) -> list[float] | None:
+        """Parses a comma separated list of `count` numbers, or returns None."""
+        try:
+            values = [float(value) for value in text.split(",")]
+        except ValueError:
+            return None
+        return values if len(values) == count else None
+
+
+    # trails shown in the gallery and maps, found with the grid index
+    shown = list(range(len(summaries)))
+    inputs, problem = [], None
+    if show.value == "near a place":
+        inputs = [place, radius]
+        point = numbers(place.value, 2)
+        if point is None:
+            problem = "Enter a place as latitude, longitude."
+        else:
+            shown = trail_index.near(*point, radius.value)
+    elif show.value == "in an area":
+        inputs = [area]
+        box = numbers(area.value, 4)
+        if box is None:
+            problem = "Enter an area as south, west, north, east."
+        else:
+            shown = trail_index.viewport(*box)
+
+    summary = mo.md(problem or f"{len(shown)} of {len(summaries)} trails")
+    mo.hstack([show, *inputs, summary], justify="start", align="center")
+    return (shown,)
+
+
+@app.cell(hide_code=True)
+def _(mo, shown, summaries):
+    # summary cards of the gallery, one row per shown trail; selecting a row shows its map
+    selector = mo.ui.table(
+        [
+            {"#": index, "trail": summaries[index]["name"], "km": round(summaries[index]["length"] / 1_000, 1), "points": summaries[index]["points"]}
+            for index in shown
+        ],
+        selection="single",
+        page_size=12,
+        label="Select a trail to show its map",
+    )
+    return (selector,)
+
+
+@app.cell(hide_code=True)
+async def _(
+    FoliumRenderer,
+    HERE,
+    card,
+    get_trail,
+    mo,
+    quality,
+    selector,
+    shown,
+    summaries,
+    tiles,
+    trails,
+    view,
+):
+    # only this cell runs again when the map style, track detail or selection changes
+    def lazy_card(index):
+        async def render():
+            return card(await get_trail(index), renderer, quality.value)
+
+        return mo.lazy(render, show_loading_indicator=True)
+
+
+    renderer = FoliumRenderer(tiles.value, HERE)
+    controls = mo.right(mo.hstack([view, quality, tiles]))
+    if view.value == "gallery":
+        if selector.value:
+            detail = card(await get_trail(selector.value[0]["#"]), renderer, quality.value)
+        else:
+            detail = mo.md("Select a trail in the table to show its map.")
+        content = [renderer.overview(summaries, trails, shown), selector, detail]
+    elif view.value == "one map":
+        # every shown trail on a single map, so there is one set of tiles instead of one per trail
+        for _index in mo.status.progress_bar(shown, title="Loading trails", remove_on_exit=True):
+            await get_trail(_index)
+        content = [renderer.overview(summaries, trails, shown, quality.value)]
+    else:
+        # maps are only created once they are scrolled into view
+        content = [lazy_card(index) for index in shown]
 
-    mo.vstack([mo.right(tiles)] + trails, gap=2)
+    mo.vstack([controls] + content, gap=2)
     return
 
 
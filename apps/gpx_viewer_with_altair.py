@@ -6,6 +6,8 @@
 #     "altair_tiles>=0.4.0",
 #     "gpxpy>=1.6.2",
 #     "marimo>=0.18.3",
+#     "numpy>=2.0.0",
+#     "xyzservices>=2023.10.0",
 # ]
 # [tool.marimo.display]
 # theme = "dark"
@@ -24,86 +26,28 @@ def _():
 
 
 @app.cell(hide_code=True)
-def _():
-    from dataclasses import dataclass, field
-    from itertools import pairwise
-
+def _(mo):
+    # the parsers and the chart libraries are imported here as well, so that they are installed in the browser
     import altair as alt
     import altair_tiles as til
-    from gpxpy import parse
-    from gpxpy.geo import haversine_distance
-
-
-    @dataclass
-    class Trail:
-        name: str
-        track: list[tuple] = field(default_factory=list)
-        centre: float = field(init=False)
-        length: float = field(init=False)
-
-        def __post_init__(self):
-            if self.track:
-                avg_lat = sum(p[0] for p in self.track) / len(self.track)
-                avg_lon = sum(p[1] for p in self.track) / len(self.track)
-                self.centre = (avg_lat, avg_lon)
-                self.length = sum([haversine_distance(p[0][0], p[0][1], p[1][0], p[1][1]) for p in pairwise(self.track)])
-            else:
-                self.centre = (52.0, 5.0)  # Default fallback (Netherlands approx)
-
-
-    def get_gpx_data(name, contents):
-        """Parses contents of GPX file and returns name, center_lat, center_lon, and points."""
-        # with open(file_path, "r") as gpx_file:
-        #     gpx = parse(gpx_file)
-        gpx = parse(contents)
-
-        name = name
-        points = []
-        for track in gpx.tracks:
-            if track.name:
-                name = track.name
-            for segment in track.segments:
-                for point in segment.points:
-                    points.append((point.latitude, point.longitude))
-
-        if not track:
-            for route in gpx.routes:
-                if route.name:
-                    name = route.name
-                for point in route.points:
-                    points.append((point.latitude, point.longitude))
-
-        return Trail(name, points)
-
-
-    def map_track(trail: Trail, tiles: str):
-        data = alt.Data(values=[{"latitude": p[0], "longitude": p[1]} for p in trail.track])
-        track_chart = (
-            alt.Chart(data)
-            .mark_line(color="red", strokeWidth=3)
-            .encode(
-                longitude="longitude:Q",
-                latitude="latitude:Q",
-                # Add tooltips if the columns exist in your GPX
-                tooltip=[
-                    # alt.Tooltip("time", title="Time", format="%H:%M:%S"),
-                    # alt.Tooltip("ele", title="Elevation (m)"),
-                    alt.Tooltip("latitude:Q", title="Lat"),
-                    alt.Tooltip("longitude:Q", title="Lon"),
-                ],
-            )
-            .project(type="mercator")
-        )
-        m = til.add_tiles(track_chart, provider=tiles).properties(width=600, height=400)
-        return m
-    return get_gpx_data, map_track
+    import gpxpy
+    import numpy as np
+    import xyzservices
 
+    from gpx_trails import LEVELS, MAX_UPLOAD_MB, AltairRenderer, default_tiles, load_batch, summarise, upload_batch
 
-@app.cell(hide_code=True)
-def _(mo):
     HERE = mo.notebook_location()
+    return AltairRenderer, HERE, LEVELS, MAX_UPLOAD_MB, default_tiles, load_batch, summarise, upload_batch
 
-    files = mo.ui.file(filetypes=[".gpx"], kind="area", multiple=True)
+
+@app.cell(hide_code=True)
+def _(HERE, LEVELS, MAX_UPLOAD_MB, default_tiles, mo):
+    files = mo.ui.file(filetypes=[".gpx"], kind="area", multiple=True, max_size=MAX_UPLOAD_MB * 1_000_000)
+    quality = mo.ui.dropdown(
+        options=["auto", *LEVELS],
+        value="auto",
+        label="Track detail",
+    )
     tiles = mo.ui.dropdown(
         options=[
             "Cartodb Positron",
@@ -112,10 +56,11 @@ def _(mo):
             "Stadia Outdoors",
             "Stadia StamenTerrain",
         ],
-        value="Stadia Outdoors",
+        # a style with prefetched tiles if the build downloaded them
+        value=default_tiles(HERE),
         label="Choose a map style",
     )
-    return files, tiles
+    return files, quality, tiles
 
 
 @app.cell
@@ -125,16 +70,62 @@ def _(files, mo):
 
 
 @app.cell(hide_code=True)
-def _(files, get_gpx_data, map_track, mo, tiles):
+async def _(files, load_batch, mo, upload_batch):
+    # too large and duplicate uploads are skipped before anything is parsed, unreadable ones while parsing
+    sources, skipped = upload_batch(files.value)
+    loaded = {}
+    if sources:
+        with mo.status.progress_bar(total=len(sources), title="Reading files", remove_on_exit=True) as bar:
+            loaded, unreadable = await load_batch(
+                sources, loaded=lambda number, trail: bar.update(subtitle=sources[number]["name"])
+            )
+        skipped += unreadable
+    # in the order of the uploads, not in the order in which they were parsed
+    parsed = [loaded[number] for number in sorted(loaded)]
+
+    mo.callout(mo.md("Skipped:\n\n" + "\n".join(f"- {reason}" for reason in skipped)), kind="warn") if skipped else None
+    return (parsed,)
+
+
+@app.cell(hide_code=True)
+def _(AltairRenderer, HERE, mo, parsed, quality, summarise, tiles):
+    from functools import partial
+
+
+    def duration(seconds):
+        hours, minutes = divmod(round(seconds / 60), 60)
+        return f"{hours}:{minutes:02d} h"
+
+
+    def charts(trail):
+        profile = renderer.profile(trail)
+        map_ = renderer.track(trail, quality=quality.value)
+        return mo.vstack([map_, profile]) if profile else map_
+
+
+    renderer = AltairRenderer(tiles.value, HERE)
     trails = []
-    for file in files.value:
-        trail = get_gpx_data(file.name, file.contents)
-        meta = mo.vstack(
-            [mo.md(trail.name), mo.stat(label="trail length", value=str(round(trail.length / 1_000, 1)) + " km")]
-        )
-        trails.append(mo.hstack([meta, map_track(trail, tiles=tiles.value)], widths=[1, 6]))
-
-    mo.vstack([mo.right(tiles)] + trails, gap=2)
+    for trail in parsed:
+        stats = [mo.stat(label="trail length", value=str(round(trail.length / 1_000, 1)) + " km")]
+        if trail.ascent is not None:
+            stats.append(mo.stat(label="ascent / descent", value=f"{trail.ascent:.0f} / {trail.descent:.0f} m"))
+        if trail.moving_time:
+            stats.append(
+                mo.stat(
+                    label="moving time",
+                    value=duration(trail.moving_time),
+                    caption=f"of {duration(trail.elapsed_time)}",
+                )
+            )
+            stats.append(mo.stat(label="moving speed", value=f"{trail.moving_speed * 3.6:.1f} km/h"))
+        meta = mo.vstack([mo.md(trail.name), *stats])
+        # charts are only created once they are scrolled into view
+        chart = mo.lazy(partial(charts, trail), show_loading_indicator=True)
+        trails.append(mo.hstack([meta, chart], widths=[1, 6]))
+
+    # all trails on one map first, then a map of every trail once it is scrolled into view
+    overview = [renderer.overview([summarise(trail) for trail in parsed], dict(enumerate(parsed)))] if len(parsed) > 1 else []
+    mo.vstack([mo.right(mo.hstack([quality, tiles]))] + overview + trails, gap=2)
     return
 
 
@@ -0,0 +1,291 @@
+"""
+Benchmark for the build script.
+
+This script generates synthetic marimo notebooks at several scales, runs the `main`
+function of the build script on them and records how long each stage takes. The marimo
+exporter is replaced by a stub `uvx` command that writes a small HTML file and runtime
+assets, so the benchmark runs offline and measures the build pipeline itself: discovery,
+export scheduling, the export cache and index rendering.
+
+Every scale is built three times:
+1. cold: with an empty export cache
+2. warm: again without changes, so every notebook should be restored from the cache
+3. one-changed: after editing a single notebook
+
+The script can be run from the root directory of the repository:
+    uv run benchmarks/build_benchmark.py [--scales 10,100,1000] [--jobs 4] [--export-ms 50]
+
+The results are written as JSON to benchmarks/results/<commit>.json (or --output), so
+that the results of different commits can be compared.
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "jinja2==3.1.3",
+#     "fire==0.7.0",
+#     "loguru==0.7.0",
+#     "brotli==1.1.0",
+#     "numpy>=2.0.0",
+#     "gpxpy>=1.6.2"
+# ]
+# ///
+
+import importlib.util
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from types import ModuleType
+from typing import Iterable, List, Union
+
+import fire
+
+from loguru import logger
+
+# Root of the repository and the build script under test
+ROOT: Path = Path(__file__).resolve().parent.parent
+BUILD_SCRIPT: Path = ROOT / ".github" / "scripts" / "build.py"
+
+# Dependency headers of the synthetic notebooks; notebooks with the same header would
+# share an environment with --shared-envs
+DEPENDENCY_SETS: List[List[str]] = [
+    [],
+    ["marimo"],
+    ["marimo", "numpy==2.3.0"],
+    ["marimo", "polars==1.30.0", "altair==5.4.1"],
+    ["marimo", "pandas==2.3.0", "numpy==2.3.0", "altair==4.2.0"],
+    ["marimo>=0.18.3", "folium>=0.20.0", "gpxpy>=1.6.2"],
+]
+
+# Stand-in for `uvx marimo`: answers `marimo --version` and writes an export with a few
+# runtime assets, after sleeping for the configured export time
+STUB_UVX = '''#!{python}
+import os, sys, time
+from pathlib import Path
+
+args = sys.argv[1:]
+if args[:2] == ["marimo", "--version"]:
+    print("0.0.0-benchmark")
+    sys.exit(0)
+
+output = Path(args[args.index("-o") + 1])
+notebook = Path(args[args.index("-o") - 1])
+time.sleep(float(os.environ.get("BENCHMARK_EXPORT_MS", "0")) / 1000)
+output.parent.mkdir(parents=True, exist_ok=True)
+output.write_text("<html><body>" + notebook.read_text()[:2000] + "</body></html>")
+assets = output.parent / "assets"
+assets.mkdir(exist_ok=True)
+for i in range(3):
+    (assets / f"runtime-{{i}}.js").write_text("// marimo runtime stub\\n" * 2000)
+'''
+
+
+def _load_build() -> ModuleType:
+    """Import the build script as a module.
+
+    Returns:
+        ModuleType: The build script module
+    """
+    spec = importlib.util.spec_from_file_location("build", BUILD_SCRIPT)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _notebook_source(index: int, dependencies: List[str]) -> str:
+    """Generate the source of a synthetic marimo notebook.
+
+    Args:
+        index (int): Number of the notebook, used to make every source unique
+        dependencies (List[str]): Dependencies for the inline script metadata
+
+    Returns:
+        str: Source code of the notebook
+    """
+    header: str = ""
+    if dependencies:
+        lines: str = "".join(f'#     "{dep}",\n' for dep in dependencies)
+        header = f'# /// script\n# requires-python = ">=3.12"\n# dependencies = [\n{lines}# ]\n# ///\n\n'
+
+    cells: str = "".join(
+        f"\n\n@app.cell\ndef _():\n    value_{cell} = {index} * {cell}\n    return (value_{cell},)\n"
+        for cell in range(5)
+    )
+    return f'{header}import marimo\n\napp = marimo.App(width="medium")\n{cells}\n\nif __name__ == "__main__":\n    app.run()\n'
+
+
+def _generate_project(project: Path, count: int, seed: int = 0) -> None:
+    """Generate a project with synthetic notebooks and apps.
+
+    Three quarters of the notebooks go into notebooks/ and the rest into apps/, spread
+    over a few sub-folders, each with one of the dependency headers.
+
+    Args:
+        project (Path): Directory in which to create the notebooks/ and apps/ folders
+        count (int): Total number of notebooks and apps
+        seed (int, optional): Seed for the choice of dependency headers. Defaults to 0.
+
+    Returns:
+        None
+    """
+    rng = random.Random(seed)
+    for index in range(count):
+        folder: Path = project / ("apps" if index % 4 == 3 else "notebooks") / f"group_{index % 7}"
+        folder.mkdir(parents=True, exist_ok=True)
+        (folder / f"notebook_{index:05d}.py").write_text(_notebook_source(index, rng.choice(DEPENDENCY_SETS)))
+
+
+def _run(build: ModuleType, project: Path, run: str, count: int, jobs: int) -> dict:
+    """Run one build of a project and summarise its timing report.
+
+    Args:
+        build (ModuleType): The build script module
+        project (Path): Directory containing the notebooks/ and apps/ folders
+        run (str): Name of the run, e.g. "cold"
+        count (int): Number of notebooks in the project
+        jobs (int): Number of parallel export jobs
+
+    Returns:
+        dict: Durations of the build and its stages, and the cache hit rate
+    """
+    start: float = time.perf_counter()
+    build.main(
+        output_dir=project / "_site",
+        template=ROOT / "templates" / "tailwind.html.j2",
+        build_dir=project / "_build",
+        jobs=jobs,
+    )
+    total: float = time.perf_counter() - start
+
+    report: dict = json.loads((project / "_build" / "timings.json").read_text())
+    stages: dict = {}
+    for stage in report["stages"]:
+        stages[stage["stage"]] = round(stages.get(stage["stage"], 0.0) + stage["seconds"], 4)
+
+    notebooks: List[dict] = report["notebooks"]
+    hits: int = sum(1 for n in notebooks if n.get("cache") == "hit")
+    wall: List[float] = sorted(n["seconds"] for n in notebooks)
+    # Time in the export stage that is not spent in the exports themselves, assuming
+    # perfect parallelism over the jobs
+    overhead: float = stages.get("export", 0.0) - sum(wall) / max(1, jobs)
+    return {
+        "notebooks": count,
+        "jobs": jobs,
+        "run": run,
+        "total_seconds": round(total, 4),
+        "stages": stages,
+        "cache_hits": hits,
+        "cache_misses": len(notebooks) - hits,
+        "cache_hit_rate": round(hits / len(notebooks), 4) if notebooks else None,
+        "notebook_seconds_median": wall[len(wall) // 2] if wall else None,
+        "notebook_seconds_max": wall[-1] if wall else None,
+        "scheduling_overhead_seconds": round(max(0.0, overhead), 4),
+        "notebooks_per_second": round(count / total, 2) if total else None,
+    }
+
+
+def _commit() -> str:
+    """Return the current git commit of the repository, or "unknown" outside git.
+
+    Returns:
+        str: Commit hash
+    """
+    try:
+        result = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True)
+        return result.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main(
+    scales: Union[int, str, Iterable[int]] = (10, 100, 1000),
+    jobs: int = 4,
+    export_ms: float = 50,
+    output: Union[str, Path, None] = None,
+) -> None:
+    """Benchmark the build script on synthetic notebooks.
+
+    Command line arguments:
+        --scales: Numbers of notebooks to benchmark, comma separated (default: 10,100,1000)
+        --jobs: Number of parallel export jobs (default: 4)
+        --export-ms: Simulated duration of a single export in milliseconds (default: 50)
+        --output: Path of the JSON results (default: benchmarks/results/<commit>.json)
+
+    Returns:
+        None
+    """
+    if isinstance(scales, str):
+        scales = [int(s) for s in scales.split(",")]
+    elif isinstance(scales, int):
+        scales = [scales]
+
+    commit: str = _commit()
+    output_file: Path = Path(output) if output else ROOT / "benchmarks" / "results" / f"{commit[:12]}.json"
+
+    build: ModuleType = _load_build()
+
+    # Only the benchmark's own progress is of interest
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    logger.add(sys.stderr, level="INFO", filter=lambda record: record["name"] == __name__)
+
+    results: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="marimo-benchmark-") as tmp:
+        # Put the stub exporter in front of the real uvx
+        bin_dir: Path = Path(tmp) / "bin"
+        bin_dir.mkdir()
+        stub: Path = bin_dir / "uvx"
+        stub.write_text(STUB_UVX.format(python=sys.executable))
+        stub.chmod(0o755)
+        os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ['PATH']}"
+        os.environ["BENCHMARK_EXPORT_MS"] = str(export_ms)
+
+        cwd: Path = Path.cwd()
+        try:
+            for count in scales:
+                project: Path = Path(tmp) / f"project_{count}"
+                _generate_project(project, count)
+                # The build script discovers notebooks relative to the working directory
+                os.chdir(project)
+
+                for run in ("cold", "warm", "one-changed"):
+                    if run == "one-changed":
+                        changed: Path = next((project / "notebooks").rglob("*.py"))
+                        changed.write_text(changed.read_text() + "\n# changed\n")
+                    result: dict = _run(build, project, run, count, jobs)
+                    results.append(result)
+                    logger.info(
+                        f"{count:>5} notebooks, {run:<11}: {result['total_seconds']:>7.2f}s total, "
+                        f"cache hit rate {result['cache_hit_rate']:.0%}, stages {result['stages']}"
+                    )
+                os.chdir(cwd)
+        finally:
+            os.chdir(cwd)
+
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "config": {"scales": list(scales), "jobs": jobs, "export_ms": export_ms},
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f"Results written to {output_file}")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,182 @@
+"""
+Benchmark for the trail processing of the GPX viewers.
+
+This script times the steps of apps/gpx_trails.py, the module that both GPX viewer apps
+import, on the GPX files in apps/public/gpx-trails/ outside of marimo:
+1. gpxpy: parsing with gpxpy's object model
+2. stream: streaming the XML into NumPy arrays (read_gpx)
+3. compact: decoding the compact copy that the build writes (read_compact)
+4. geometry: computing the statistics and levels of detail of a Trail
+5. folium / altair: rendering a map of the trail, if the map library is installed
+
+With --scale, every track is repeated that many times, to measure large files.
+
+The script can be run from the root directory of the repository:
+    uv run benchmarks/trails_benchmark.py [--scale 1] [--repeat 5]
+
+The results are written as JSON to benchmarks/results/trails-<commit>.json (or --output),
+so that the results of different commits can be compared.
+"""
+
+# /// script
+# requires-python = ">=3.12"
+# dependencies = [
+#     "jinja2==3.1.3",
+#     "fire==0.7.0",
+#     "loguru==0.7.0",
+#     "brotli==1.1.0",
+#     "numpy>=2.0.0",
+#     "gpxpy>=1.6.2",
+#     "folium>=0.20.0",
+#     "altair>=6.0.0",
+#     "altair_tiles>=0.4.0",
+#     "xyzservices>=2023.10.0",
+# ]
+# ///
+
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+from typing import Callable, List, Union
+
+import fire
+
+from loguru import logger
+
+from build_benchmark import ROOT, _commit, _load_build
+
+# The shared trail module of the GPX viewer apps
+sys.path.insert(0, str(ROOT / "apps"))
+import gpx_trails  # noqa: E402
+
+TRAILS: Path = ROOT / "apps" / "public" / "gpx-trails"
+
+
+def _best(step: Callable[[], object], repeat: int) -> float:
+    """Time a step several times and return the fastest run.
+
+    Args:
+        step (Callable[[], object]): Function to time
+        repeat (int): Number of runs
+
+    Returns:
+        float: Duration of the fastest run in seconds
+    """
+    durations: List[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        step()
+        durations.append(time.perf_counter() - start)
+    return round(min(durations), 5)
+
+
+def _scaled(gpx_file: Path, scale: int) -> bytes:
+    """Read a GPX file with its track points repeated.
+
+    Args:
+        gpx_file (Path): GPX file to read
+        scale (int): Number of times to repeat the track points
+
+    Returns:
+        bytes: Contents of the GPX file
+    """
+    source: bytes = gpx_file.read_bytes()
+    if scale == 1 or b"<trkpt" not in source:
+        return source
+    start: int = source.index(b"<trkpt")
+    end: int = source.rindex(b"</trkpt>") + len(b"</trkpt>")
+    return source[:start] + source[start:end] * scale + source[end:]
+
+
+def main(scale: int = 1, repeat: int = 5, output: Union[str, Path, None] = None) -> None:
+    """Benchmark the trail processing on the GPX files of the GPX viewers.
+
+    Command line arguments:
+        --scale: Number of times to repeat the points of every track (default: 1)
+        --repeat: Number of runs of every step, of which the fastest is kept (default: 5)
+        --output: Path of the JSON results (default: benchmarks/results/trails-<commit>.json)
+
+    Returns:
+        None
+    """
+    commit: str = _commit()
+    output_file: Path = Path(output) if output else ROOT / "benchmarks" / "results" / f"trails-{commit[:12]}.json"
+
+    build = _load_build()
+
+    # Only the benchmark's own progress is of interest
+    logger.remove()
+    logger.add(sys.stderr, level="WARNING")
+    logger.add(sys.stderr, level="INFO", filter=lambda record: record["name"] == __name__)
+
+    results: List[dict] = []
+    with tempfile.TemporaryDirectory(prefix="trails-benchmark-") as tmp:
+        # Write the (scaled) GPX files and let the build write their compact copies
+        folder: Path = Path(tmp)
+        for gpx_file in sorted(TRAILS.glob("*.gpx")):
+            (folder / gpx_file.name).write_bytes(_scaled(gpx_file, scale))
+        build._compact_folder(folder)
+        manifest: dict = gpx_trails.load_manifest(folder)
+
+        renderers: dict = {}
+        if gpx_trails.folium is not None:
+            renderers["folium"] = gpx_trails.FoliumRenderer("OpenStreetMap Mapnik")
+        if gpx_trails.alt is not None:
+            renderers["altair"] = gpx_trails.AltairRenderer("OpenStreetMap Mapnik")
+
+        for gpx_file in sorted(folder.glob("*.gpx")):
+            contents: bytes = gpx_file.read_bytes()
+            entry: dict = manifest[gpx_file.name]
+            compact: bytes = (folder / entry["data"]).read_bytes()
+            trail = gpx_trails.read_gpx(BytesIO(contents), gpx_file.name)
+
+            seconds: dict = {
+                "gpxpy": _best(lambda: gpx_trails.parse_with_gpxpy(contents, gpx_file.name), repeat),
+                "stream": _best(lambda: gpx_trails.read_gpx(BytesIO(contents), gpx_file.name), repeat),
+                "compact": _best(lambda: gpx_trails.read_compact(compact, entry), repeat),
+                "geometry": _best(lambda: gpx_trails.Trail(trail.name, trail.track, trail.times, trail.elevation), repeat),
+            }
+            # Rendering includes the serialisation that the notebook does to show the map
+            if "folium" in renderers:
+                seconds["folium"] = _best(lambda: renderers["folium"].track(trail)._repr_html_(), repeat)
+            if "altair" in renderers:
+                seconds["altair"] = _best(lambda: renderers["altair"].track(trail).to_json(), repeat)
+
+            result: dict = {
+                "file": gpx_file.name,
+                "bytes": len(contents),
+                "compact_bytes": len(compact),
+                "points": len(trail.track),
+                "seconds": seconds,
+                "stream_speedup": round(seconds["gpxpy"] / seconds["stream"], 2) if seconds["stream"] else None,
+                "compact_speedup": round(seconds["stream"] / seconds["compact"], 2) if seconds["compact"] else None,
+            }
+            results.append(result)
+            logger.info(f"{gpx_file.name:<32} {len(trail.track):>8} points: {seconds}")
+
+    output_file.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_file, "w") as f:
+        json.dump(
+            {
+                "commit": commit,
+                "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "cpu_count": os.cpu_count(),
+                "config": {"scale": scale, "repeat": repeat},
+                "results": results,
+            },
+            f,
+            indent=2,
+        )
+    logger.info(f"Results written to {output_file}")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -17,6 +17,10 @@ curl -LsSf https://astral.sh/uv/install.sh | sh
 # This is interesting as it works without explicitly installing
 # the dependencies before running this script - uv handles this automatically
 # 
+# The 'main' command builds the site once. Use 'watch' instead of 'main' to keep the
+# site up to date while editing: after the first build only the changed notebook is
+# exported again, and index.html is only rendered again when the template changes.
+#
 # Parameters:
 #   --output_dir '_site': Specifies where to output the generated site files
 #                         '_site' is a common convention for static site generators
@@ -24,6 +28,6 @@ curl -LsSf https://astral.sh/uv/install.sh | sh
 #   --template 'templates/tailwind.html.j2': Specifies which template to use
 #                                            This uses the Tailwind CSS template
 #                                            for a clean, responsive design
-uv run build.py \
+uv run build.py main \
        --output_dir '_site' \
        --template 'templates/tailwind.html.j2'
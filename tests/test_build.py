@@ -0,0 +1,145 @@
+"""
+Tests of the build script, .github/scripts/build.py.
+"""
+
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+# stderr of uv when it can not download a package or reach the package index
+TRANSIENT = {
+    "download": """\
+  × Failed to download `marimo==0.18.3`
+  ├─▶ Failed to fetch: `https://files.pythonhosted.org/packages/marimo-0.18.3-py3-none-any.whl`
+  ├─▶ Request failed after 3 retries
+  ├─▶ error sending request for url (https://files.pythonhosted.org/packages/marimo-0.18.3-py3-none-any.whl)
+  ├─▶ client error (Connect)
+  ├─▶ dns error: failed to lookup address information: Temporary failure in name resolution
+  ╰─▶ failed to lookup address information: Temporary failure in name resolution
+""",
+    "fetch": """\
+  × No solution found when resolving dependencies:
+  ╰─▶ error sending request for url (https://pypi.org/simple/numpy/)
+""",
+    "offline": """\
+error: Failed to fetch: `https://pypi.org/simple/marimo/`
+  Caused by: Could not connect, are you offline?
+  Caused by: Request failed after 3 retries
+""",
+    "status": """\
+error: Failed to fetch: `https://pypi.org/simple/gpxpy/`
+  Caused by: HTTP status server error (503 Service Unavailable) for url (https://pypi.org/simple/gpxpy/)
+""",
+    "rate limit": """\
+  × Failed to download `numpy==2.3.0`
+  ╰─▶ HTTP status client error (429 Too Many Requests) for url (https://files.pythonhosted.org/numpy.whl)
+""",
+    "reset": """\
+error: Request failed after 3 retries
+  Caused by: error sending request for url (https://pypi.org/simple/folium/)
+  Caused by: connection reset by peer
+""",
+}
+
+# stderr of exports that failed because of the notebook or its dependencies
+PERMANENT = {
+    "key error": """\
+Traceback (most recent call last):
+  File "/tmp/notebook.py", line 12, in <module>
+    status = codes[503]
+KeyError: 503
+""",
+    "timeout": """\
+Traceback (most recent call last):
+  File "/tmp/notebook.py", line 20, in <module>
+    urllib.request.urlopen(url, timeout=-1)
+ValueError: timeout must be positive
+""",
+    "notebook connection": """\
+Traceback (most recent call last):
+  File "/tmp/notebook.py", line 8, in <module>
+    requests.get("http://localhost:9999")
+requests.exceptions.ConnectionError: Failed to fetch http://localhost:9999: Connection refused
+""",
+    "resolution": """\
+  × No solution found when resolving dependencies:
+  ╰─▶ Because there is no version of numpy==99.0 and you require numpy==99.0, we can conclude that your
+      requirements are unsatisfiable.
+""",
+    "syntax": """\
+error: Failed to parse: `notebook.py`
+  Caused by: TOML parse error at line 3, column 5
+""",
+}
+
+
+@pytest.fixture
+def abort(build):
+    """The event that stops the build (--fail-fast), cleared again after the test."""
+    yield build._abort
+    build._abort.clear()
+
+
+@pytest.mark.parametrize("stderr", TRANSIENT.values(), ids=TRANSIENT.keys())
+def test_transient_errors_are_retried(build, stderr):
+    assert build._TRANSIENT_ERROR.search(stderr)
+
+
+@pytest.mark.parametrize("stderr", PERMANENT.values(), ids=PERMANENT.keys())
+def test_other_errors_are_not_retried(build, stderr):
+    assert not build._TRANSIENT_ERROR.search(stderr)
+
+
+def test_run_command_does_not_start_after_abort(build, abort, tmp_path):
+    marker = tmp_path / "started"
+    abort.set()
+
+    with pytest.raises(subprocess.CalledProcessError) as error:
+        build._run_command([sys.executable, "-c", f"open({str(marker)!r}, 'w').close()"])
+
+    assert error.value.returncode < 0
+    assert not marker.exists()
+    assert not build._running
+
+
+def test_export_is_not_retried_after_abort(build, abort, monkeypatch, tmp_path):
+    calls = []
+
+    def fail(cmd, timeout=None):
+        calls.append(cmd)
+        # another export fails while this one waits to retry
+        threading.Timer(0.1, abort.set).start()
+        raise subprocess.CalledProcessError(2, cmd, output="", stderr=TRANSIENT["download"])
+
+    monkeypatch.setattr(build, "_run_command", fail)
+    timing = {}
+    start = time.perf_counter()
+    exported = build._run_export(
+        tmp_path / "notebook.py", tmp_path / "site", False, None, timing=timing, retries=2, backoff=30
+    )
+
+    assert not exported
+    assert len(calls) == 1
+    assert timing["error"] == "stopped after an earlier failure"
+    # the wait for the retry ends with the build
+    assert time.perf_counter() - start < 10
+
+
+def test_export_retries_transient_errors(build, monkeypatch, tmp_path):
+    calls = []
+
+    def fail(cmd, timeout=None):
+        calls.append(cmd)
+        raise subprocess.CalledProcessError(2, cmd, output="", stderr=TRANSIENT["offline"])
+
+    monkeypatch.setattr(build, "_run_command", fail)
+    timing = {}
+    exported = build._run_export(
+        tmp_path / "notebook.py", tmp_path / "site", False, None, timing=timing, retries=2, backoff=0
+    )
+
+    assert not exported
+    assert len(calls) == 3 and timing["attempts"] == 3
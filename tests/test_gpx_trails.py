@@ -0,0 +1,376 @@
+"""
+Tests of apps/gpx_trails.py, the trail module of the GPX viewer apps, and of the compact
+tracks that the build writes for it.
+
+Run them from the root directory of the repository:
+    uv run --with pytest --with numpy --with gpxpy --with jinja2 --with fire --with loguru pytest tests
+"""
+
+import asyncio
+import json
+import math
+import shutil
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from itertools import pairwise
+from pathlib import Path
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+ROOT = Path(__file__).resolve().parents[1]
+TRAILS = ROOT / "apps" / "public" / "gpx-trails"
+GPX_FILES = sorted(TRAILS.glob("*.gpx"))
+
+sys.path.insert(0, str(ROOT / "apps"))
+import gpx_trails  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def compact(build, tmp_path_factory):
+    """A folder with copies of the GPX files and the compact tracks and manifest that the build writes."""
+    folder = tmp_path_factory.mktemp("gpx-trails")
+    for gpx_file in GPX_FILES:
+        shutil.copy(gpx_file, folder)
+    assert build._compact_folder(folder) == len(GPX_FILES)
+    return folder
+
+
+def reference_grid_cells(track, cell=gpx_trails.GRID_CELL):
+    """Cells of a track, sampled point by point in plain Python."""
+    cells = set()
+    for a, b in pairwise(track.tolist()):
+        steps = max(1, math.ceil(max(abs(b[0] - a[0]), abs(b[1] - a[1])) / (cell / 2)))
+        for step in range(steps):
+            lat = a[0] + (b[0] - a[0]) * step / steps
+            lon = a[1] + (b[1] - a[1]) * step / steps
+            cells.add((math.floor(lat / cell), math.floor(lon / cell)))
+    cells.add((math.floor(track[-1, 0] / cell), math.floor(track[-1, 1] / cell)))
+    return [list(c) for c in sorted(cells)]
+
+
+def make_trail(points, name="trail"):
+    """A straight trail of `points` points going north."""
+    return gpx_trails.Trail(name, np.column_stack((np.linspace(52.0, 52.1, points), np.full(points, 5.8))))
+
+
+@pytest.mark.parametrize("gpx_file", GPX_FILES, ids=lambda path: path.name)
+def test_read_gpx_matches_gpxpy(gpx_file):
+    contents = gpx_file.read_bytes()
+    streamed = gpx_trails.read_gpx(BytesIO(contents), gpx_file.name)
+    parsed = gpx_trails.parse_with_gpxpy(contents, gpx_file.name)
+
+    assert streamed.name == parsed.name
+    np.testing.assert_array_equal(streamed.track, parsed.track)
+    np.testing.assert_array_equal(streamed.elevation, parsed.elevation)
+    np.testing.assert_array_equal(streamed.times, parsed.times)
+    assert streamed.length == pytest.approx(parsed.length)
+    assert streamed.ascent == pytest.approx(parsed.ascent)
+    assert streamed.moving_time == pytest.approx(parsed.moving_time)
+
+
+def test_read_gpx_and_gpxpy_times_in_utc():
+    # the offset changes halfway, e.g. when a ride crosses the end of summer time
+    contents = b"""<?xml version="1.0"?>
+    <gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">
+      <trk><trkseg>
+        <trkpt lat="52.00" lon="5.80"><time>2024-10-27T02:50:00+02:00</time></trkpt>
+        <trkpt lat="52.01" lon="5.80"><time>2024-10-27T02:55:00+01:00</time></trkpt>
+        <trkpt lat="52.02" lon="5.80"><time>2024-10-27T02:00:00Z</time></trkpt>
+      </trkseg></trk>
+    </gpx>"""
+    expected = np.array(["2024-10-27T00:50", "2024-10-27T01:55", "2024-10-27T02:00"], dtype="datetime64[ms]")
+
+    for trail in gpx_trails.read_gpx(BytesIO(contents), "dst.gpx"), gpx_trails.parse_with_gpxpy(contents, "dst.gpx"):
+        np.testing.assert_array_equal(trail.times, expected)
+        assert trail.elapsed_time == 70 * 60
+
+
+def test_read_gpx_route_points():
+    contents = b"""<?xml version="1.0"?>
+    <gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1">
+      <rte><name>Route</name><rtept lat="52.0" lon="5.8"/><rtept lat="52.1" lon="5.9"/></rte>
+    </gpx>"""
+    trail = gpx_trails.read_gpx(BytesIO(contents), "route.gpx")
+
+    assert trail.name == "Route"
+    np.testing.assert_array_equal(trail.track, [[52.0, 5.8], [52.1, 5.9]])
+    assert trail.elevation is None and trail.times is None
+
+
+def test_read_gpx_without_points():
+    contents = b'<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1"><trk><name>Empty</name></trk></gpx>'
+    with pytest.raises(ValueError):
+        gpx_trails.read_gpx(BytesIO(contents), "empty.gpx")
+
+
+def test_empty_trail():
+    trail = gpx_trails.Trail("empty")
+
+    assert trail.length == 0.0 and trail.bbox == (*trail.centre, *trail.centre)
+    assert all(len(points) == 0 for points in trail.levels.values())
+
+
+def test_compact_round_trip(compact):
+    manifest = gpx_trails.load_manifest(compact)
+    assert sorted(manifest) == [gpx_file.name for gpx_file in GPX_FILES]
+
+    for gpx_file in GPX_FILES:
+        entry = manifest[gpx_file.name]
+        original = gpx_trails.read_gpx(BytesIO(gpx_file.read_bytes()), gpx_file.name)
+        decoded = gpx_trails.read_compact((compact / entry["data"]).read_bytes(), entry)
+
+        assert decoded.name == original.name == entry["name"]
+        assert len(decoded.track) == entry["points"]
+        # microdegrees, decimetres and seconds
+        np.testing.assert_allclose(decoded.track, original.track, rtol=0, atol=0.5e-6 + 1e-12)
+        np.testing.assert_allclose(decoded.elevation, original.elevation, rtol=0, atol=0.05 + 1e-9)
+        assert np.abs((decoded.times - original.times) / np.timedelta64(1, "ms")).max() <= 500
+        # the summary in the manifest is that of the decoded track
+        assert decoded.length == pytest.approx(entry["length"], abs=0.05)
+        assert list(decoded.bbox) == pytest.approx(entry["bbox"])
+        assert gpx_trails.summarise(entry=entry) == {
+            "name": decoded.name,
+            "length": pytest.approx(decoded.length, abs=0.05),
+            "points": len(decoded.track),
+            "bbox": pytest.approx(list(decoded.bbox)),
+        }
+
+
+def test_compact_manifest_version(compact):
+    manifest = json.loads((compact / "manifest.json").read_text())
+    assert manifest["version"] == gpx_trails.COMPACT_VERSION
+    assert manifest["cell"] == gpx_trails.GRID_CELL
+
+
+def test_compact_skips_unreadable_files(build, tmp_path):
+    (tmp_path / "broken.gpx").write_text("<gpx>")
+    (tmp_path / "empty.gpx").write_text('<gpx xmlns="http://www.topografix.com/GPX/1/1"><trk/></gpx>')
+    shutil.copy(GPX_FILES[0], tmp_path)
+
+    assert build._compact_folder(tmp_path) == 1
+    assert list(gpx_trails.load_manifest(tmp_path)) == [GPX_FILES[0].name]
+
+
+def test_grid_cells_match_manifest(compact):
+    for entry in gpx_trails.load_manifest(compact).values():
+        decoded = gpx_trails.read_compact((compact / entry["data"]).read_bytes(), entry)
+        assert gpx_trails.grid_cells(decoded.track).tolist() == entry["cells"]
+
+
+@pytest.mark.parametrize("gpx_file", GPX_FILES, ids=lambda path: path.name)
+def test_grid_cells_match_reference(gpx_file):
+    track = gpx_trails.read_gpx(BytesIO(gpx_file.read_bytes()), gpx_file.name).track
+    assert gpx_trails.grid_cells(track).tolist() == reference_grid_cells(track)
+
+
+def test_grid_cells_fill_long_segments():
+    # a single segment of 0.05 degrees east passes through six cells
+    track = np.array([[52.005, 5.801], [52.005, 5.851]])
+    assert gpx_trails.grid_cells(track).tolist() == [[5200, column] for column in range(580, 586)]
+    assert gpx_trails.grid_cells(track[:1]).tolist() == [[5200, 580]]
+
+
+def test_trail_cache_evicts_least_recently_used():
+    first, second, third = make_trail(100, "first"), make_trail(100, "second"), make_trail(100, "third")
+    cache = gpx_trails.TrailCache(max_bytes=2 * gpx_trails.TrailCache.nbytes(first))
+    cache.put("first", first)
+    cache.put("second", second)
+    # reading the first trail makes the second one the least recently used
+    assert cache.get("first") is first
+    cache.put("third", third)
+
+    assert cache.get("second") is None
+    assert cache.get("first") is first and cache.get("third") is third
+    assert cache.size == sum(cache.nbytes(trail) for trail in (first, third))
+
+
+def test_trail_cache_keeps_one_oversized_trail():
+    cache = gpx_trails.TrailCache(max_bytes=1)
+    trail = make_trail(10)
+    cache.put("trail", trail)
+    cache.put("trail", trail)
+
+    assert cache.get("trail") is trail
+    assert cache.size == cache.nbytes(trail)
+
+
+def test_upload_batch_skips_large_and_duplicate_files():
+    uploads = [
+        SimpleNamespace(name="a.gpx", contents=b"a" * 10),
+        SimpleNamespace(name="large.gpx", contents=b"b" * 2_000_001),
+        SimpleNamespace(name="copy of a.gpx", contents=b"a" * 10),
+        SimpleNamespace(name="c.gpx", contents=b"c" * 10),
+    ]
+    sources, skipped = gpx_trails.upload_batch(uploads, max_bytes=2_000_000)
+
+    assert [source["name"] for source in sources] == ["a.gpx", "c.gpx"]
+    assert all(source["upload"] and len(source["digest"]) == 64 for source in sources)
+    assert skipped == ["large.gpx is larger than 2 MB", "copy of a.gpx is the same file as a.gpx"]
+
+
+def test_load_batch_skips_unreadable_uploads():
+    uploads = [SimpleNamespace(name=gpx_file.name, contents=gpx_file.read_bytes()) for gpx_file in GPX_FILES[:2]]
+    empty = SimpleNamespace(
+        name="empty.gpx",
+        contents=b'<gpx xmlns="http://www.topografix.com/GPX/1/1" version="1.1"><trk><trkseg/></trk></gpx>',
+    )
+    bad = SimpleNamespace(name="bad.gpx", contents=b"nope")
+    sources, _ = gpx_trails.upload_batch([uploads[0], bad, uploads[1], empty])
+    loaded = {}
+
+    trails, skipped = asyncio.run(gpx_trails.load_batch(sources, loaded=loaded.__setitem__))
+
+    assert sorted(trails) == [0, 2]
+    assert sorted(skipped) == [
+        "bad.gpx can not be read as a GPX file: Error parsing XML: syntax error: line 1, column 0",
+        "empty.gpx can not be read as a GPX file: GPX file without track or route points",
+    ]
+    # every source is reported once it is done, the unreadable ones with their error
+    assert sorted(loaded) == [0, 1, 2, 3] and isinstance(loaded[1], ValueError) and isinstance(loaded[3], ValueError)
+    assert loaded[0] is trails[0] and loaded[2] is trails[2]
+
+
+class Storage(dict):
+    """A stand-in for the browser's localStorage."""
+
+    def getItem(self, key):
+        return self.get(key)
+
+    def setItem(self, key, value):
+        self[key] = value
+
+
+@pytest.fixture
+def github_tree():
+    """A local stand-in for the GitHub tree API, which answers 304 to a request with the current ETag."""
+    server = SimpleNamespace(
+        etag='"v1"',
+        tree=[{"path": "apps/public/gpx-trails/a.gpx"}, {"path": "README.md"}, {"path": "apps/public/gpx-trails/b.gpx"}],
+        statuses=[],
+    )
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.headers.get("If-None-Match") == server.etag:
+                server.statuses.append(304)
+                self.send_response(304)
+                self.send_header("ETag", server.etag)
+                self.end_headers()
+                return
+            body = json.dumps({"tree": server.tree}).encode()
+            server.statuses.append(200)
+            self.send_response(200)
+            self.send_header("ETag", server.etag)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    server.url = f"http://127.0.0.1:{httpd.server_port}/repos/org/repo/git/trees/main?recursive=1"
+    yield server
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_list_gpx_files_revalidates_with_etag(github_tree):
+    storage = Storage()
+    expected = ["apps/public/gpx-trails/a.gpx", "apps/public/gpx-trails/b.gpx"]
+
+    assert gpx_trails.list_gpx_files(github_tree.url, storage) == expected
+    assert json.loads(storage[github_tree.url]) == {"etag": '"v1"', "paths": expected}
+
+    # an unchanged tree is answered with a 304, and the stored paths are used
+    github_tree.tree = []
+    assert gpx_trails.list_gpx_files(github_tree.url, storage) == expected
+    assert github_tree.statuses == [200, 304]
+
+    # a changed tree is downloaded again, and stored with its new ETag
+    github_tree.etag, github_tree.tree = '"v2"', [{"path": "apps/public/gpx-trails/c.gpx"}]
+    assert gpx_trails.list_gpx_files(github_tree.url, storage) == ["apps/public/gpx-trails/c.gpx"]
+    assert json.loads(storage[github_tree.url])["etag"] == '"v2"'
+    assert github_tree.statuses == [200, 304, 200]
+
+
+def test_list_gpx_files_without_storage(github_tree):
+    assert gpx_trails.list_gpx_files(github_tree.url) == ["apps/public/gpx-trails/a.gpx", "apps/public/gpx-trails/b.gpx"]
+    assert gpx_trails.list_gpx_files(github_tree.url) == ["apps/public/gpx-trails/a.gpx", "apps/public/gpx-trails/b.gpx"]
+    assert github_tree.statuses == [200, 200]
+
+
+@pytest.fixture
+def tile_server(build, tmp_path):
+    """The build's tile_server stand-in for a tile provider, with one stored tile, on a free port."""
+    stored = tmp_path / "stored-tiles"
+    (stored / "8" / "131").mkdir(parents=True)
+    (stored / "8" / "131" / "84.png").write_bytes(b"stored tile")
+    httpd = build._tile_server(stored, port=0)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield SimpleNamespace(url=f"http://127.0.0.1:{httpd.server_port}", httpd=httpd)
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_tile_server_serves_stored_and_placeholder_tiles(tile_server):
+    with urllib.request.urlopen(f"{tile_server.url}/8/131/84.png") as response:
+        assert response.read() == b"stored tile"
+    with urllib.request.urlopen(f"{tile_server.url}/12/2100/1349.png") as response:
+        assert response.headers["Content-Type"] == "image/png"
+        assert response.read().startswith(b"\x89PNG\r\n\x1a\n")
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(f"{tile_server.url}/tiles.json")
+    assert error.value.code == 404
+
+
+def test_prefetch_tiles_from_tile_server(build, tile_server, tmp_path):
+    site, cache = tmp_path / "site", tmp_path / "cache"
+    public = site / "apps" / "public"
+    (public / "gpx-trails").mkdir(parents=True)
+    shutil.copy(TRAILS / "Ermelo.gpx", public / "gpx-trails")
+    build._compact_folder(public / "gpx-trails")
+    url = tile_server.url + "/{z}/{x}/{y}.png"
+
+    assert build._prefetch_tiles(site, cache, url, "OpenStreetMap Mapnik", (8, 12)) == 18
+    tiles = public / "tiles" / "openstreetmap-mapnik"
+    assert len(list(tiles.rglob("*.png"))) == 18
+    assert (tiles / "8" / "131" / "84.png").read_bytes() == b"stored tile"
+    info = json.loads((tiles / "tiles.json").read_text())
+    assert (info["min_zoom"], info["max_zoom"]) == (8, 12)
+    assert info["bounds"] == gpx_trails.load_manifest(public / "gpx-trails")["Ermelo.gpx"]["bbox"]
+
+    # the apps find the tiles, and start with the only style that has them
+    assert gpx_trails.local_tiles("OpenStreetMap Mapnik", site / "apps")["url"] == "public/tiles/openstreetmap-mapnik/{z}/{x}/{y}.png"
+    assert gpx_trails.local_tiles("CartoDB Voyager", site / "apps") is None
+    assert gpx_trails.default_tiles(site / "apps") == "OpenStreetMap Mapnik"
+    build._prefetch_tiles(site, cache, url, gpx_trails.DEFAULT_TILES, (8, 9))
+    assert json.loads((public / "tiles" / "styles.json").read_text()) == ["OpenStreetMap Mapnik", "Stadia Outdoors"]
+    assert gpx_trails.default_tiles(site / "apps") == gpx_trails.DEFAULT_TILES
+
+    # later builds take the tiles from the cache, without the tile server
+    tile_server.httpd.shutdown()
+    other = tmp_path / "other"
+    shutil.copytree(site, other, ignore=shutil.ignore_patterns("tiles"))
+    assert build._prefetch_tiles(other, cache, url, "OpenStreetMap Mapnik", (8, 12)) == 18
+
+
+def test_default_tiles_without_prefetched_tiles(tmp_path):
+    assert gpx_trails.default_tiles(tmp_path) == gpx_trails.DEFAULT_TILES
+
+
+def test_prefetch_tiles_needs_a_tile_url(build):
+    with pytest.raises(ValueError, match="--tile-url"):
+        build.main(tiles=True)
+    with pytest.raises(ValueError, match="Unknown map style"):
+        build._prefetch_tiles(Path("_site"), Path("_build/tiles"), "http://127.0.0.1/{z}/{x}/{y}.png", "Google Maps")